@@ -1,11 +1,23 @@
 from flask import Flask, request, jsonify, render_template
-from data_clients import OpenTripMapClient, OpenWeatherClient, GeoNamesClient
-from recommender import filter_pois, recommend_pois
+from data_clients import (
+    OpenTripMapClient, OpenWeatherClient, GeoNamesClient, poi_from_detail, client_stats,
+    normalize_place_name, geohash_encode,
+)
+from recommender import filter_pois, recommend_pois, prerank_features
 from optimizer import ItineraryGA
+from ga_pool import run_days
+from geo import TravelTimeMatrix
+from cf_model import log_plan
+from async_clients import (
+    AsyncOpenTripMapClient, AsyncOpenWeatherClient, AsyncGeoNamesClient,
+    run_shared, inflight as async_inflight,
+)
 from config import Config
 from flask_cors import CORS
+import asyncio
 import os
 import requests
+import time
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 CORS(app)
@@ -27,8 +39,147 @@ def chat():
 
 
 
+@app.route("/api/stats")
+def stats():
+    out = client_stats()
+    out["async_inflight"] = async_inflight.stats()
+    return jsonify(out)
+
+
+def _user_profile(payload):
+    return {
+        "budget_per_day": payload.get("budget_per_day"),
+        "interests": payload.get("interests", []),
+        "preferred_kinds": ",".join(payload.get("preferred_kinds", [])),
+        "start_time": payload.get("start_time", "09:00"),
+        "end_time": payload.get("end_time", "18:00"),
+        "transport": payload.get("transport", "walking"),
+        # optional filters (filter_rules): kinds to avoid and a radius in metres around the centre
+        "exclude_kinds": payload.get("exclude_kinds", []),
+        "max_distance": payload.get("max_distance"),
+        # optional, for collaborative filtering: a stable user id and xids of POIs they liked/visited
+        "user_id": payload.get("user_id"),
+        "history": payload.get("history", []),
+    }
+
+
+def _plan_deadline(payload, started):
+    """time.time() by which the itinerary GA must finish, or None for no budget."""
+    try:
+        budget = float(payload.get("time_budget") or Config.GA_TIME_BUDGET)
+    except (TypeError, ValueError):
+        budget = Config.GA_TIME_BUDGET
+    if budget <= 0:
+        return None
+    if Config.GA_MAX_TIME_BUDGET > 0:
+        budget = min(budget, Config.GA_MAX_TIME_BUDGET)
+    return started + budget
+
+
+def _collect_pois(features, details):
+    pois = []
+    for (xid, item), (detail, error) in zip(features, details):
+        if error is not None:
+            continue
+        poi = poi_from_detail(detail, item)  # ✅ normalize important fields
+        if poi is None:   # 🚫 skip unnamed places
+            continue
+
+        print(f"✅ Added POI: {poi['name']} ({poi['lat']}, {poi['lon']})")
+        pois.append(poi)
+    return pois
+
+
+def _corpus_key(city, lat, lon):
+    # POI corpus the TF-IDF model is shared across: the city, else a ~40 km geohash cell
+    return normalize_place_name(city) if city else geohash_encode(lat, lon, 4)
+
+
+def _build_plan(city, days, user_profile, pois, weather, corpus_key=None, deadline=None):
+    """
+    Filter, recommend and optimize: the CPU-only part shared by both plan endpoints.
+    deadline: see _plan_deadline; the GAs return their best plan so far when it passes.
+    """
+    # 3) Filter + recommend
+    filtered = filter_pois(pois, user_profile, weather_info=weather)
+    recs = recommend_pois(filtered, user_profile, top_n=80, city=corpus_key)
+
+    for r in recs:
+        lat = (
+            r.get("lat")
+            or r.get("latitude")
+            or (r.get("point") or {}).get("lat")
+            or (r.get("geometry", {}).get("coordinates")[1] if r.get("geometry", {}).get("coordinates") else None)
+        )
+        lon = (
+            r.get("lon")
+            or r.get("longitude")
+            or (r.get("point") or {}).get("lon")
+            or (r.get("geometry", {}).get("coordinates")[0] if r.get("geometry", {}).get("coordinates") else None)
+        )
+
+        try:
+            r["lat"] = float(lat) if lat not in (None, 0, "0", "0.0") else None
+            r["lon"] = float(lon) if lon not in (None, 0, "0", "0.0") else None
+        except Exception:
+            r["lat"], r["lon"] = None, None
+
+        r["score"] = float(r.get("score") or 0)
+
+
+    # 4) Multi-day itinerary
+    # only POIs with coordinates can be routed; all pairwise travel times computed once,
+    # each day's GA gets its block by index
+    routable = [r for r in recs if r["lat"] is not None and r["lon"] is not None]
+    travel = TravelTimeMatrix.from_pois(routable).minutes(user_profile.get("transport", "walking"))
+    split_size = max(1, len(routable) // days)
+    day_numbers, gas = [], []
+    for i in range(days):
+        day = slice(i * split_size, (i + 1) * split_size)
+        day_pois = routable[day]
+        if not day_pois:
+            continue
+        day_numbers.append(i + 1)
+        gas.append(ItineraryGA(day_pois, user_profile,
+                               pop_size=Config.GA_POP_SIZE,
+                               generations=Config.GA_GENERATIONS,
+                               mutation_rate=Config.GA_MUTATION_RATE,
+                               travel_minutes=travel[day, day],
+                               patience=Config.GA_PATIENCE,
+                               min_improvement=Config.GA_MIN_IMPROVEMENT,
+                               deadline=deadline))
+    # days are independent problems: serial, or spread over the GA process pool (Config.GA_EXECUTION)
+    itineraries = [
+        {"day": n, "plan": day_plan}
+        for n, day_plan in zip(day_numbers, run_days(gas))
+    ]
+
+    try:
+        # implicit feedback for the offline CF model (cf_model.py)
+        log_plan(Config.PLAN_LOG_PATH, {
+            "user_id": user_profile.get("user_id"),
+            "city": corpus_key or city,
+            "interests": user_profile.get("interests"),
+            "preferred_kinds": user_profile.get("preferred_kinds"),
+            "history": user_profile.get("history"),
+            "plan_xids": [p["xid"] for day in itineraries for p in day["plan"]],
+            "recommended_xids": [r.get("xid") for r in recs[:20]],
+        }, max_bytes=Config.PLAN_LOG_MAX_BYTES)
+    except OSError:
+        pass
+
+    return {
+        "city": city,
+        "days": days,
+        "itinerary": itineraries,
+        "top_recommendations": recs[:20],
+        "weather": weather
+    }
+
+
 @app.route("/api/plan", methods=["POST"])
 def plan_trip():
+    started = time.time()
     payload = request.get_json()
     if payload is None:
         return jsonify({"error": "Invalid JSON"}), 400
@@ -66,14 +217,7 @@ def plan_trip():
 
 
     days = int(payload.get("days", 1))
-    user_profile = {
-        "budget_per_day": payload.get("budget_per_day"),
-        "interests": payload.get("interests", []),
-        "preferred_kinds": ",".join(payload.get("preferred_kinds", [])),
-        "start_time": payload.get("start_time", "09:00"),
-        "end_time": payload.get("end_time", "18:00"),
-        "transport": payload.get("transport", "walking"),
-    }
+    user_profile = _user_profile(payload)
 
     # 1) Fetch POIs
     try:
@@ -81,42 +225,11 @@ def plan_trip():
     except Exception as e:
         return jsonify({"error": "Failed to fetch POIs", "details": str(e)}), 502
 
-    pois = []
-    for item in raw.get("features", [])[:150]:
-        xid = item["properties"].get("xid") or item.get("id")
-        if not xid:
-            continue
-        try:
-            detail = OpenTripMapClient.get_place(xid)
-        except Exception:
-            continue
-
-        # ✅ normalize important fields
-        point = detail.get("point") or item.get("geometry", {}).get("coordinates")
-        if isinstance(point, list) and len(point) == 2:
-            lon, lat = point[0], point[1]
-        else:
-            lat = detail.get("point", {}).get("lat")
-            lon = detail.get("point", {}).get("lon")
-
-        name = detail.get("name")
-        if not name:   # 🚫 skip unnamed places
-            continue
-
-        poi = {
-            "xid": detail.get("xid"),
-            "name": name,
-            "kinds": detail.get("kinds", ""),
-            "lat": float(lat) if lat else None,
-            "lon": float(lon) if lon else None,
-            "wikipedia_extracts": detail.get("wikipedia_extracts", {}),
-            "info": detail.get("info", {}),
-        }
-
-        print(f"✅ Added POI: {poi['name']} ({poi['lat']}, {poi['lon']})")
-        pois.append(poi)
-
-
+    # 🔍 Cheap pre-rank on the radius features, then fetch details only for the survivors
+    features = prerank_features(raw.get("features", [])[:150], user_profile,
+                                top_k=Config.DETAIL_TOP_K, radius=Config.DEFAULT_RADIUS)
+    details = OpenTripMapClient.get_places([xid for xid, _ in features])
+    pois = _collect_pois(features, details)
 
     # 2) Get weather (optional)
     try:
@@ -124,58 +237,76 @@ def plan_trip():
     except Exception:
         weather = None
 
-    # 3) Filter + recommend
-    filtered = filter_pois(pois, user_profile, weather_info=weather)
-    recs = recommend_pois(filtered, user_profile, top_n=80)
+    return jsonify(_build_plan(city, days, user_profile, pois, weather, _corpus_key(city, lat, lon),
+                               deadline=_plan_deadline(payload, started)))
 
-    for r in recs:
-        lat = (
-            r.get("lat")
-            or r.get("latitude")
-            or (r.get("point") or {}).get("lat")
-            or (r.get("geometry", {}).get("coordinates")[1] if r.get("geometry", {}).get("coordinates") else None)
-        )
-        lon = (
-            r.get("lon")
-            or r.get("longitude")
-            or (r.get("point") or {}).get("lon")
-            or (r.get("geometry", {}).get("coordinates")[0] if r.get("geometry", {}).get("coordinates") else None)
-        )
 
+async def _fetch_plan_inputs(lat, lon, user_profile):
+    """Network stage of the async plan; runs on the shared client loop."""
+    async def weather_or_none():
         try:
-            r["lat"] = float(lat) if lat not in (None, 0, "0", "0.0") else None
-            r["lon"] = float(lon) if lon not in (None, 0, "0", "0.0") else None
+            return await AsyncOpenWeatherClient.onecall(lat, lon, exclude=["minutely", "alerts"])
         except Exception:
-            r["lat"], r["lon"] = None, None
+            return None
 
-        r["score"] = float(r.get("score") or 0)
+    # radius search and weather only need the coordinates, so run them together
+    weather_task = asyncio.ensure_future(weather_or_none())
+    try:
+        raw = await AsyncOpenTripMapClient.radius_places(lat, lon, radius=Config.DEFAULT_RADIUS, limit=150)
+    except Exception:
+        weather_task.cancel()
+        raise
+    features = prerank_features(raw.get("features", [])[:150], user_profile,
+                                top_k=Config.DETAIL_TOP_K, radius=Config.DEFAULT_RADIUS)
+    details = await AsyncOpenTripMapClient.get_places([xid for xid, _ in features])
+    return features, details, await weather_task
+
+
+@app.route("/api/plan/async", methods=["POST"])
+async def plan_trip_async():
+    """
+    Same contract as /api/plan, but all upstream I/O is awaited on the shared
+    async client pool (geocoding first, then radius search and weather
+    concurrently, then the detail calls). Needs aiohttp and Flask[async].
+
+    Flask runs an async view to completion in the worker thread that took
+    the request, so each request still holds one WSGI worker thread while
+    it waits; the gain is concurrency within a plan and a shared connection
+    pool, not more plans per worker. Serving more plans per thread would
+    need an ASGI server.
+    """
+    started = time.time()
+    payload = request.get_json()
+    if payload is None:
+        return jsonify({"error": "Invalid JSON"}), 400
 
+    city = payload.get("city")
+    lat = payload.get("lat")
+    lon = payload.get("lon")
+    if (not lat or not lon) and city:
+        try:
+            geoinfo = await run_shared(AsyncGeoNamesClient.get_coords(city))
+            lat = geoinfo.get("lat")
+            lon = geoinfo.get("lon")
+        except Exception as e:
+            return jsonify({
+                "error": f"Failed to get coordinates for {city}",
+                "details": str(e)
+            }), 400
+    if not lat or not lon:
+        return jsonify({
+            "error": "No coordinates found. Please provide a valid city name or lat/lon."
+        }), 400
 
-    # 4) Multi-day itinerary
-    split_size = max(1, len(recs) // days)
-    itineraries = []
-    for i in range(days):
-        day_pois = recs[i * split_size : (i + 1) * split_size]
-        if not day_pois:
-            continue
-        ga = ItineraryGA(day_pois, user_profile,
-                         pop_size=Config.GA_POP_SIZE,
-                         generations=Config.GA_GENERATIONS,
-                         mutation_rate=Config.GA_MUTATION_RATE)
-        day_plan = ga.run()
-        itineraries.append({
-            "day": i + 1,
-            "plan": day_plan
-        })
-
-    response = {
-        "city": city,
-        "days": days,
-        "itinerary": itineraries,
-        "top_recommendations": recs[:20],
-        "weather": weather
-    }
-    return jsonify(response)
+    days = int(payload.get("days", 1))
+    user_profile = _user_profile(payload)
+    try:
+        features, details, weather = await run_shared(_fetch_plan_inputs(lat, lon, user_profile))
+    except Exception as e:
+        return jsonify({"error": "Failed to fetch POIs", "details": str(e)}), 502
+    pois = _collect_pois(features, details)
+    return jsonify(_build_plan(city, days, user_profile, pois, weather, _corpus_key(city, lat, lon),
+                               deadline=_plan_deadline(payload, started)))
 
 
 if __name__ == "__main__":
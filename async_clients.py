@@ -0,0 +1,280 @@
+"""
+asyncio variants of the API clients in data_clients.py.
+
+All coroutines here run on one shared background event loop that owns a
+single aiohttp connection pool, so concurrent plans reuse connections.
+Code running on another loop (e.g. an async Flask view) hands work over
+with `await run_shared(coro)`. Caches, rate limiters, the gazetteer and
+fixture recording are shared with the synchronous clients; their
+blocking parts (SQLite, loading the gazetteer) run in the loop's default
+executor so they never stall the other requests on the loop.
+"""
+import asyncio
+import json
+import threading
+from urllib.parse import urlsplit
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency, only needed for the async path
+    aiohttp = None
+
+from config import Config
+from data_clients import (
+    OpenTripMapClient, OpenWeatherClient, GeoNamesClient, RETRY_STATUSES, backoff_delay,
+    get_rate_limiter, get_place_cache, get_weather_cache, get_spatial_index,
+    normalize_place_name, project_place, record_fixture,
+)
+
+
+class _SharedLoop:
+    """Background thread running the event loop that owns the aiohttp session."""
+
+    def __init__(self):
+        self.loop = None
+        self.session = None
+        self._lock = threading.Lock()
+
+    def get_loop(self):
+        with self._lock:
+            if self.loop is None:
+                if aiohttp is None:
+                    raise RuntimeError("aiohttp is required for the async API clients")
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="irs-async-clients", daemon=True).start()
+                self.loop = loop
+        return self.loop
+
+    async def get_session(self):
+        # only ever called on the shared loop, so no lock is needed here
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=Config.HTTP_POOL_MAXSIZE * Config.HTTP_POOL_CONNECTIONS,
+                limit_per_host=Config.HTTP_POOL_MAXSIZE,
+                force_close=not Config.HTTP_KEEP_ALIVE,
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+
+_shared = _SharedLoop()
+
+
+async def run_shared(coro):
+    """Await `coro` on the shared client loop from any other event loop."""
+    loop = _shared.get_loop()
+    try:
+        if asyncio.get_running_loop() is loop:
+            return await coro
+    except RuntimeError:
+        pass
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+async def _blocking(fn, *args):
+    """Run a blocking call (SQLite, file loading) in the executor of the running loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on the shared loop: one in-flight task per key."""
+
+    def __init__(self):
+        self.executed = 0
+        self.shared = 0
+        self._tasks = {}
+
+    async def do(self, key, coro_fn):
+        task = self._tasks.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(coro_fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.shared += 1
+        # shield so one cancelled waiter does not cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._tasks)}
+
+
+inflight = AsyncSingleFlight()
+
+
+class AsyncHTTPError(Exception):
+    """Non-retryable (or retries exhausted) HTTP error status from an async call."""
+
+    def __init__(self, status, url, message=""):
+        super().__init__(f"{status} error for url: {url} {message}".strip())
+        self.status = status
+        self.url = url
+
+
+async def http_get_json(url, params=None, timeout=None, limiter=None):
+    """
+    Async counterpart of data_clients.http_get returning decoded JSON, with
+    the same retry, backoff, rate-limiting and recording behaviour.
+    """
+    session = await _shared.get_session()
+    if timeout is None:
+        host = urlsplit(url).hostname
+        timeout = Config.HTTP_TIMEOUTS.get(host, Config.HTTP_TIMEOUT)
+    retries = Config.HTTP_RETRIES
+    for attempt in range(retries + 1):
+        started = await limiter.acquire_async() if limiter is not None else None
+        status = failure = None
+        try:
+            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                status = resp.status
+                headers = dict(resp.headers)
+                text = await resp.text()
+                final_url = str(resp.url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status, failure = None, e
+        finally:
+            # released on every outcome, cancellation included, so no slot can leak
+            if limiter is not None:
+                if status is None:
+                    limiter.release(started, error=True)
+                else:
+                    limiter.release(started, status=status, error=status >= 500)
+        if failure is not None:
+            if attempt >= retries:
+                raise failure
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        if status in RETRY_STATUSES and attempt < retries:
+            await asyncio.sleep(backoff_delay(attempt, headers))
+            continue
+        if status >= 400:
+            raise AsyncHTTPError(status, final_url, text[:200])
+        body = json.loads(text)
+        if Config.HTTP_RECORD_DIR:
+            record_fixture(final_url, status, headers.get("Content-Type"), body, Config.HTTP_RECORD_DIR)
+        return body
+
+
+class AsyncOpenTripMapClient:
+
+    @staticmethod
+    async def radius_places(lat, lon, radius=2000, kinds=None, limit=50, rate=None):
+        """Async OpenTripMapClient.radius_places sharing the same spatial index."""
+        index = get_spatial_index(kinds, rate)
+        if index is None:
+            return await AsyncOpenTripMapClient.radius_request(lat, lon, radius, kinds, limit, rate)
+        circles = index.plan(lat, lon, radius, int(limit))
+        responses = await asyncio.gather(*(
+            AsyncOpenTripMapClient.radius_request(f_lat, f_lon, f_radius, kinds, limit, rate)
+            for f_lat, f_lon, f_radius in circles
+        ))
+        for (f_lat, f_lon, f_radius), resp in zip(circles, responses):
+            if not isinstance(resp, dict):
+                return resp
+            features = resp.get("features") or []
+            index.add(f_lat, f_lon, f_radius, features, complete=len(features) < int(limit))
+        return {"type": "FeatureCollection", "features": index.radius(lat, lon, radius, int(limit))}
+
+    @staticmethod
+    async def radius_request(lat, lon, radius=2000, kinds=None, limit=50, rate=None):
+        url = OpenTripMapClient.radius_url(lat, lon, radius, kinds, limit, rate)
+        return await inflight.do(
+            ("otm_radius", url), lambda: http_get_json(url, limiter=get_rate_limiter("otm_radius"))
+        )
+
+    @staticmethod
+    async def get_place(xid):
+        """Projected, cached place details, like OpenTripMapClient.get_place."""
+        cache = get_place_cache()
+        if cache is not None:
+            cached = await _blocking(cache.get, xid)
+            if cached is not None:
+                return cached
+
+        async def load():
+            url = f"{OpenTripMapClient.BASE}/xid/{xid}?apikey={OpenTripMapClient.KEY}"
+            detail = project_place(await http_get_json(url, limiter=get_rate_limiter("otm_xid")))
+            if cache is not None:
+                await _blocking(cache.set, xid, detail)
+            return detail
+
+        return await inflight.do(("otm_xid", xid), load)
+
+    @staticmethod
+    async def get_places(xids, max_concurrency=None):
+        """Async OpenTripMapClient.get_places: (detail, error) tuples in input order."""
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or Config.OTM_MAX_CONCURRENCY))
+
+        async def fetch(xid):
+            async with semaphore:
+                try:
+                    return await AsyncOpenTripMapClient.get_place(xid), None
+                except Exception as e:
+                    return None, e
+
+        return await asyncio.gather(*(fetch(xid) for xid in xids))
+
+
+class AsyncOpenWeatherClient:
+
+    @staticmethod
+    async def onecall(lat, lon, exclude=None):
+        """Async OpenWeatherClient.onecall sharing the same WeatherCache."""
+        def load():
+            return http_get_json(OpenWeatherClient.ONECALL, params=OpenWeatherClient.onecall_params(lat, lon, exclude))
+
+        cache = get_weather_cache()
+        key = OpenWeatherClient.onecall_key(lat, lon, exclude, cache is not None)
+        if cache is None:
+            return await inflight.do(key, load)
+        state, data, refresh = cache.lookup(key)
+        if refresh:
+            # the loop only keeps weak references to tasks: hold one until it finishes
+            task = asyncio.ensure_future(_revalidate(cache, key, load))
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+        if state is not None:
+            return data
+
+        async def load_and_store():
+            result = await load()
+            cache.store(key, result)
+            return result
+
+        return await inflight.do(key, load_and_store)
+
+
+_background = set()  # revalidation tasks still running
+
+
+async def _revalidate(cache, key, load):
+    try:
+        cache.store(key, await load())
+    except Exception:
+        cache.refresh_done(key)  # keep serving the stale entry
+
+
+class AsyncGeoNamesClient:
+
+    @staticmethod
+    async def search_place(name, maxRows=10):
+        params = {"q": name, "maxRows": maxRows, "username": GeoNamesClient.USER}
+        return await http_get_json(f"{GeoNamesClient.BASE}/searchJSON", params=params)
+
+    @staticmethod
+    async def get_coords(city):
+        """Async GeoNamesClient.get_coords sharing the memo, gazetteer and cache."""
+        key = normalize_place_name(city)
+        if not key:
+            return {}
+        # the gazetteer (first use loads the whole file) and the SQLite cache are blocking
+        coords = await _blocking(GeoNamesClient.local_coords, key)
+        if coords is None:
+            if Config.GEONAMES_OFFLINE:
+                return {}
+            resp = await inflight.do(
+                ("geonames_search", key), lambda: AsyncGeoNamesClient.search_place(city, maxRows=1)
+            )
+            coords = await _blocking(GeoNamesClient.remember_coords, key, resp)
+        return dict(coords) if coords else {}
@@ -0,0 +1,83 @@
+"""
+Solution quality vs wall time: single-population ItineraryGA against the
+island model (ga_pool.IslandModel) on synthetic day problems.
+
+Each configuration is run on the same random problems with several
+seeds; the table reports the mean best fitness (higher is better), the
+mean number of stops that fit the day and the mean wall time per problem.
+
+    python benchmarks/island_ga.py --pois 40 80 --islands 2 4 --generations 120
+    GA_EXECUTION=process python benchmarks/island_ga.py --islands 4 8   # islands on separate cores
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from config import Config
+from ga_pool import IslandModel, shutdown_pool
+from optimizer import ItineraryGA
+
+
+def make_problem(n, seed, lat=48.8566, lon=2.3522, spread=0.05):
+    rng = np.random.default_rng(seed)
+    return [
+        {"xid": f"P{i}", "name": f"POI {i}", "lat": lat + rng.uniform(-spread, spread),
+         "lon": lon + rng.uniform(-spread, spread), "score": float(rng.uniform(0, 1))}
+        for i in range(n)
+    ]
+
+
+def measure(pois, seeds, generations, islands, interval, topology):
+    fitness, stops, seconds = [], [], []
+    for seed in seeds:
+        ga = ItineraryGA(pois, {"transport": "walking"}, pop_size=Config.GA_POP_SIZE,
+                         generations=generations, mutation_rate=Config.GA_MUTATION_RATE, seed=seed)
+        started = time.perf_counter()
+        if islands > 1:
+            best = IslandModel(ga, islands=islands, migration_interval=interval,
+                               topology=topology, seed=seed).evolve()
+        else:
+            best = ga.evolve()
+        seconds.append(time.perf_counter() - started)
+        fitness.append(float(ga.fitness(best)))
+        stops.append(len(ga.build_daily_plan(best)))
+    return statistics.mean(fitness), statistics.mean(stops), statistics.mean(seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pois", type=int, nargs="+", default=[40, 80])
+    parser.add_argument("--islands", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--generations", type=int, default=Config.GA_GENERATIONS)
+    parser.add_argument("--interval", type=int, default=Config.GA_MIGRATION_INTERVAL)
+    parser.add_argument("--topology", default=Config.GA_MIGRATION_TOPOLOGY, choices=IslandModel.TOPOLOGIES)
+    parser.add_argument("--problems", type=int, default=3)
+    parser.add_argument("--seeds", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"execution={Config.GA_EXECUTION} pop_size={Config.GA_POP_SIZE} topology={args.topology} "
+          f"interval={args.interval}")
+    print(f"{'pois':>5} {'config':<24} {'fitness':>9} {'stops':>6} {'seconds':>8}")
+    seeds = list(range(args.seeds))
+    for n in args.pois:
+        problems = [make_problem(n, 1000 + p) for p in range(args.problems)]
+        configs = [("single", 1, args.generations)]
+        for k in args.islands:
+            # same wall-clock budget per island, and the same total effort on one population
+            configs.append((f"islands={k}", k, args.generations))
+            configs.append((f"single x{k} generations", 1, args.generations * k))
+        for label, islands, generations in configs:
+            rows = [measure(pois, seeds, generations, islands, args.interval, args.topology) for pois in problems]
+            fitness, stops, seconds = (statistics.mean(col) for col in zip(*rows))
+            print(f"{n:>5} {label:<24} {fitness:>9.3f} {stops:>6.1f} {seconds:>8.3f}")
+    shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Offline evaluation of the two-phase POI retrieval used by /api/plan.
+
+For every captured city and user profile it compares the final ranking
+computed from *all* radius hits (reference) with the ranking computed when
+only the top-K pre-ranked hits get their details fetched, and reports the
+recall of the reference top-N plus the number of detail calls.
+
+Capture a dataset once (uses the API keys / caches from config.py):
+    python benchmarks/prerank_recall.py capture --city Paris --city Rome --out prerank_data.json
+
+Evaluate it offline:
+    python benchmarks/prerank_recall.py evaluate prerank_data.json --k 40 --k 60 --k 80 --k 100
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from data_clients import OpenTripMapClient, GeoNamesClient, poi_from_detail
+from recommender import filter_pois, recommend_pois, prerank_features
+
+DEFAULT_PROFILES = [
+    {"interests": ["Culture"], "preferred_kinds": "museums"},
+    {"interests": ["history", "architecture"], "preferred_kinds": "historic,architecture"},
+    {"interests": ["Kids"], "preferred_kinds": "amusements,zoos"},
+    {"interests": ["nature", "parks"], "preferred_kinds": "natural,gardens_and_parks"},
+    {"interests": ["food"], "preferred_kinds": "foods"},
+    {"interests": [], "preferred_kinds": ""},
+]
+
+
+def capture(cities, out, limit=150):
+    dataset = []
+    for city in cities:
+        coords = GeoNamesClient.get_coords(city)
+        if not coords:
+            print(f"skipping {city}: no coordinates")
+            continue
+        raw = OpenTripMapClient.radius_places(coords["lat"], coords["lon"], radius=Config.DEFAULT_RADIUS, limit=limit)
+        features = raw.get("features", [])[:limit]
+        xids = [f["properties"].get("xid") or f.get("id") for f in features]
+        details = {}
+        for xid, (detail, error) in zip(xids, OpenTripMapClient.get_places([x for x in xids if x])):
+            if error is None:
+                details[xid] = detail
+        dataset.append({"city": city, "features": features, "details": details})
+        print(f"captured {city}: {len(features)} features, {len(details)} details")
+    with open(out, "w", encoding="utf-8") as fh:
+        json.dump(dataset, fh)
+
+
+def _ranking(features, details, profile, top_k, top_n):
+    selected = prerank_features(features, profile, top_k=top_k, radius=Config.DEFAULT_RADIUS)
+    pois = []
+    calls = 0
+    for xid, item in selected:
+        detail = details.get(xid)
+        calls += 1
+        if detail is None:
+            continue
+        poi = poi_from_detail(detail, item)
+        if poi is not None:
+            pois.append(poi)
+    recs = recommend_pois(filter_pois(pois, profile), profile, top_n=top_n)
+    return [r["xid"] for r in recs], calls
+
+
+def evaluate(path, ks, top_n=80, head=20):
+    with open(path, encoding="utf-8") as fh:
+        dataset = json.load(fh)
+    totals = {k: {"recall": 0.0, "recall_head": 0.0, "calls": 0} for k in ks}
+    cases = 0
+    ref_calls = 0
+    for case in dataset:
+        for profile in DEFAULT_PROFILES:
+            reference, calls = _ranking(case["features"], case["details"], profile, None, top_n)
+            if not reference:
+                continue
+            cases += 1
+            ref_calls += calls
+            for k in ks:
+                ranked, calls = _ranking(case["features"], case["details"], profile, k, top_n)
+                totals[k]["recall"] += len(set(ranked) & set(reference)) / len(reference)
+                ref_head = set(reference[:head])
+                totals[k]["recall_head"] += len(set(ranked[:head]) & ref_head) / len(ref_head)
+                totals[k]["calls"] += calls
+    if not cases:
+        print("no cases to evaluate")
+        return
+    print(f"{cases} (city, profile) cases, reference = all hits, {ref_calls / cases:.1f} detail calls/plan")
+    print(f"{'K':>5} {'calls/plan':>11} {'recall@' + str(top_n):>10} {'recall@' + str(head):>10}")
+    for k in ks:
+        t = totals[k]
+        print(f"{k:>5} {t['calls'] / cases:>11.1f} {t['recall'] / cases:>10.3f} {t['recall_head'] / cases:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    cap = sub.add_parser("capture")
+    cap.add_argument("--city", action="append", required=True)
+    cap.add_argument("--out", default="prerank_data.json")
+    ev = sub.add_parser("evaluate")
+    ev.add_argument("dataset")
+    ev.add_argument("--k", type=int, action="append")
+    ev.add_argument("--top-n", type=int, default=80)
+    args = parser.parse_args()
+    if args.cmd == "capture":
+        capture(args.city, args.out)
+    else:
+        evaluate(args.dataset, args.k or [20, 40, 60, 80], top_n=args.top_n)
+
+
+if __name__ == "__main__":
+    main()
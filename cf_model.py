@@ -0,0 +1,226 @@
+"""
+Implicit-feedback collaborative filtering for recommend_pois.
+
+When Config.PLAN_LOG_PATH is set (it is off by default), /api/plan
+appends one JSON line per generated plan to it (user id, planned POI
+xids, the user's history), rotated at Config.PLAN_LOG_MAX_BYTES. Offline, this module
+turns those logs into a sparse user x POI confidence matrix and factorizes
+it with implicit ALS (Hu, Koren & Volinsky 2008):
+
+    python cf_model.py train --log .cache/plan_log.jsonl --out .cache/cf
+
+The factors are written as .npy files and served memory-mapped. At request
+time nothing is trained: a known user's factors are looked up, a new user
+is folded in from their history with one f x f solve, and POI scores are
+a dense dot product with the item factors.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+_log_lock = threading.Lock()
+
+
+def log_plan(path, record, max_bytes=0):
+    """
+    Append one plan record to the JSONL log at `path` (no-op when path is
+    empty). Once the log exceeds `max_bytes` (0 = no limit) it is rotated
+    to `<path>.1`, replacing the previous rotation.
+    """
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    line = json.dumps(dict(record, ts=record.get("ts", time.time())), ensure_ascii=False)
+    with _log_lock:
+        if max_bytes and os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+            os.replace(path, path + ".1")
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+
+
+def load_interactions(paths, plan_weight=1.0, history_weight=0.5):
+    """
+    (R, user_ids, item_ids) from plan logs: R is a CSR user x item matrix of
+    summed interaction weights. Records without a user_id count as a user of
+    their own, so anonymous plans still contribute co-occurrence.
+    """
+    users, items = {}, {}
+    rows, cols, vals = [], [], []
+    for path in paths:
+        with open(path, encoding="utf-8") as fh:
+            for n, line in enumerate(fh):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                user = rec.get("user_id") or f"anon:{path}:{n}"
+                pairs = [(x, plan_weight) for x in rec.get("plan_xids") or []]
+                pairs += [(x, history_weight) for x in rec.get("history") or []]
+                for xid, weight in pairs:
+                    if not xid:
+                        continue
+                    rows.append(users.setdefault(user, len(users)))
+                    cols.append(items.setdefault(xid, len(items)))
+                    vals.append(weight)
+    R = sp.csr_matrix((np.asarray(vals, dtype=np.float32), (rows, cols)),
+                      shape=(len(users), len(items)), dtype=np.float32)
+    R.sum_duplicates()
+    return R, list(users), list(items)
+
+
+def _solve_rows(R, Y, reg, alpha):
+    """ALS half-step: the least-squares factors of every row of R given the other side's factors Y."""
+    f = Y.shape[1]
+    gram = Y.T @ Y + reg * np.eye(f)
+    X = np.zeros((R.shape[0], f), dtype=np.float64)
+    for u in range(R.shape[0]):
+        start, end = R.indptr[u], R.indptr[u + 1]
+        if start == end:
+            continue
+        X[u] = _fold_in(Y, gram, R.indices[start:end], R.data[start:end], alpha)
+    return X
+
+
+def _fold_in(Y, gram, idx, weights, alpha):
+    # (Y'Y + Y'(Cu - I)Y + reg I) x = Y' Cu p(u), with Cu = 1 + alpha * r
+    c = alpha * np.asarray(weights, dtype=np.float64)
+    Yu = np.asarray(Y[idx], dtype=np.float64)
+    A = gram + (Yu.T * c) @ Yu
+    b = Yu.T @ (1.0 + c)
+    return np.linalg.solve(A, b)
+
+
+def train_als(R, factors=32, reg=0.1, alpha=20.0, iterations=15, seed=0):
+    """Implicit ALS on the confidence matrix R; returns (user factors, item factors)."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 0.01, (R.shape[0], factors))
+    Y = rng.normal(0, 0.01, (R.shape[1], factors))
+    Rt = R.T.tocsr()
+    for _ in range(iterations):
+        X = _solve_rows(R, Y, reg, alpha)
+        Y = _solve_rows(Rt, X, reg, alpha)
+    return X, Y
+
+
+def save_model(directory, user_ids, item_ids, X, Y, reg, alpha):
+    os.makedirs(directory, exist_ok=True)
+    arrays = {
+        "user_factors": np.asarray(X, dtype=np.float32),
+        "item_factors": np.asarray(Y, dtype=np.float32),
+        "item_gram": np.asarray(Y, dtype=np.float64).T @ np.asarray(Y, dtype=np.float64),
+        "user_ids": np.array(user_ids, dtype=str),
+        "item_ids": np.array(item_ids, dtype=str),
+    }
+    for name, arr in arrays.items():
+        tmp = os.path.join(directory, name + ".tmp.npy")
+        np.save(tmp, arr)
+        os.replace(tmp, os.path.join(directory, name + ".npy"))
+    # meta.json is written last; readers reload when it changes
+    meta = {"factors": int(arrays["item_factors"].shape[1]), "reg": reg, "alpha": alpha,
+            "users": len(user_ids), "items": len(item_ids), "trained_at": time.time()}
+    tmp = os.path.join(directory, "meta.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh)
+    os.replace(tmp, os.path.join(directory, "meta.json"))
+
+
+class CFModel:
+    """Trained factors, memory-mapped read-only from a save_model() directory."""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as fh:
+            self.meta = json.load(fh)
+        load = lambda name, mmap=None: np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap)
+        self.user_factors = load("user_factors", "r")
+        self.item_factors = load("item_factors", "r")
+        self.item_gram = load("item_gram")
+        self.user_row = {u: i for i, u in enumerate(load("user_ids").tolist())}
+        self.item_row = {x: i for i, x in enumerate(load("item_ids").tolist())}
+        self.reg = float(self.meta.get("reg", 0.1))
+        self.alpha = float(self.meta.get("alpha", 20.0))
+
+    def fold_in(self, xids, weights=None):
+        """Factors for a user not seen in training, from the POIs they interacted with."""
+        known = [(self.item_row[x], w) for x, w in zip(xids, weights or [1.0] * len(xids)) if x in self.item_row]
+        if not known:
+            return None
+        idx = np.array([i for i, _ in known], dtype=np.int64)
+        gram = self.item_gram + self.reg * np.eye(self.item_gram.shape[0])
+        return _fold_in(self.item_factors, gram, idx, [w for _, w in known], self.alpha).astype(np.float32)
+
+    def user_vector(self, user_id=None, history=()):
+        """Stored factors of a known user, else a fold-in of `history`, else None."""
+        row = self.user_row.get(user_id) if user_id else None
+        if row is not None:
+            return np.asarray(self.user_factors[row])
+        return self.fold_in(list(history or ()))
+
+    def item_matrix(self, xids):
+        """(n, factors) item factors for `xids`, zero rows for POIs the model has not seen."""
+        rows = np.array([self.item_row.get(x, -1) for x in xids], dtype=np.int64)
+        out = np.zeros((len(rows), self.item_factors.shape[1]), dtype=np.float32)
+        known = rows >= 0
+        out[known] = self.item_factors[rows[known]]
+        return out
+
+    def scores(self, xids, user_vector):
+        """Predicted preference of one user for each of `xids`, clipped to [0, 1]."""
+        return np.clip(self.item_matrix(xids) @ user_vector, 0.0, 1.0)
+
+
+_model = None
+_model_mtime = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Process-wide CFModel from Config.CF_MODEL_DIR (reloaded after retraining), or None."""
+    global _model, _model_mtime
+    from config import Config
+    if not Config.CF_MODEL_DIR:
+        return None
+    try:
+        mtime = os.path.getmtime(os.path.join(Config.CF_MODEL_DIR, "meta.json"))
+    except OSError:
+        return None
+    with _model_lock:
+        if _model is None or mtime != _model_mtime:
+            _model = CFModel(Config.CF_MODEL_DIR)
+            _model_mtime = mtime
+    return _model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the implicit-ALS POI model from plan logs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train = sub.add_parser("train")
+    train.add_argument("--log", action="append", required=True, help="plan log (JSONL); repeatable")
+    train.add_argument("--out", required=True, help="model directory (Config.CF_MODEL_DIR)")
+    train.add_argument("--factors", type=int, default=32)
+    train.add_argument("--reg", type=float, default=0.1)
+    train.add_argument("--alpha", type=float, default=20.0)
+    train.add_argument("--iterations", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    R, user_ids, item_ids = load_interactions(args.log)
+    if R.nnz == 0:
+        parser.error("no interactions found in the logs")
+    started = time.time()
+    X, Y = train_als(R, args.factors, args.reg, args.alpha, args.iterations)
+    save_model(args.out, user_ids, item_ids, X, Y, args.reg, args.alpha)
+    print(f"trained on {len(user_ids)} users x {len(item_ids)} POIs ({R.nnz} interactions) "
+          f"in {time.time() - started:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,103 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+
+def _parse_map(value, cast=str):
+    """Parse "key=value,key2=value2" env strings into a dict."""
+    out = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            k, v = item.split("=", 1)
+            out[k.strip()] = cast(v.strip())
+    return out
+
+
 class Config:
     OPENTRIPMAP_KEY = os.getenv("OPENTRIPMAP_KEY", "")
     OPENWEATHER_KEY = os.getenv("OPENWEATHER_KEY", "")
     GEONAMES_USERNAME = os.getenv("GEONAMES_USERNAME", "")
+    # API base URLs (point them at replay_server.py for offline runs)
+    OPENTRIPMAP_BASE = os.getenv("OPENTRIPMAP_BASE", "https://api.opentripmap.com/0.1/en/places")
+    OPENWEATHER_BASE = os.getenv("OPENWEATHER_BASE", "https://api.openweathermap.org/data")
+    GEONAMES_BASE = os.getenv("GEONAMES_BASE", "http://api.geonames.org")
+    # when set, every successful API response is saved here as a replay fixture
+    HTTP_RECORD_DIR = os.getenv("HTTP_RECORD_DIR", "")
     DEFAULT_RADIUS = float(os.getenv("DEFAULT_RADIUS", 10000))  # meters
+    # bulk POI detail fetching
+    OTM_MAX_CONCURRENCY = int(os.getenv("OTM_MAX_CONCURRENCY", 16))
+    # two-phase retrieval: fetch details only for the top-K pre-ranked radius hits (0 = all);
+    # keep it at least the 80 recommendations a plan ranks, or their recall is capped at K/80
+    DETAIL_TOP_K = int(os.getenv("DETAIL_TOP_K", 80))
+    # persistent response cache (set CACHE_DB_PATH="" to disable)
+    CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", ".cache/irs_cache.sqlite3")
+    POI_CACHE_TTL = float(os.getenv("POI_CACHE_TTL", 7 * 24 * 3600))  # seconds
+    POI_CACHE_MAX_ENTRIES = int(os.getenv("POI_CACHE_MAX_ENTRIES", 50000))
+    CACHE_TOUCH_INTERVAL = float(os.getenv("CACHE_TOUCH_INTERVAL", 300))  # seconds between LRU refreshes of a hit
+    # in-process spatial index answering /radius queries over areas fetched before
+    SPATIAL_INDEX_ENABLED = os.getenv("SPATIAL_INDEX_ENABLED", "1") not in ("0", "false", "False")
+    SPATIAL_INDEX_CELL_DEG = float(os.getenv("SPATIAL_INDEX_CELL_DEG", 0.01))  # ~1.1 km grid cells
+    SPATIAL_INDEX_TTL = float(os.getenv("SPATIAL_INDEX_TTL", 24 * 3600))  # seconds an area stays covered
+    SPATIAL_INDEX_MAX_FEATURES = int(os.getenv("SPATIAL_INDEX_MAX_FEATURES", 200000))
+    # shared HTTP session
+    HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 10))  # hosts kept in the pool
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 32))  # connections per host
+    HTTP_KEEP_ALIVE = os.getenv("HTTP_KEEP_ALIVE", "1") not in ("0", "false", "False")
+    HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+    HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.5))  # seconds
+    HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 8.0))  # seconds
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))  # seconds
+    # per-host overrides, e.g. "api.geonames.org=6,api.opentripmap.com=10"
+    HTTP_TIMEOUTS = _parse_map(os.getenv("HTTP_TIMEOUTS", ""), float)
+    # client-side rate limits per endpoint as "rate:burst" (requests/second)
+    RATE_LIMITS = _parse_map(os.getenv("RATE_LIMITS", "otm_radius=2:4,otm_xid=8:16"))
+    RATE_MAX_CONCURRENCY = int(os.getenv("RATE_MAX_CONCURRENCY", 16))  # AIMD ceiling
+    RATE_MIN_CONCURRENCY = int(os.getenv("RATE_MIN_CONCURRENCY", 1))  # AIMD floor
+    RATE_LATENCY_SPIKE_FACTOR = float(os.getenv("RATE_LATENCY_SPIKE_FACTOR", 3.0))
+    RATE_LATENCY_SPIKE_FLOOR = float(os.getenv("RATE_LATENCY_SPIKE_FLOOR", 0.5))  # seconds; faster is never a spike
+    # geocoding
+    GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", 30 * 24 * 3600))  # seconds
+    GEONAMES_GAZETTEER_PATH = os.getenv("GEONAMES_GAZETTEER_PATH", "")  # e.g. data/cities15000.txt
+    GEONAMES_GAZETTEER_ALTNAMES = os.getenv("GEONAMES_GAZETTEER_ALTNAMES", "1") not in ("0", "false", "False")
+    GEONAMES_OFFLINE = os.getenv("GEONAMES_OFFLINE", "0") not in ("0", "false", "False")  # never call GeoNames
+    # weather cache
+    WEATHER_CACHE_ENABLED = os.getenv("WEATHER_CACHE_ENABLED", "1") not in ("0", "false", "False")
+    WEATHER_GEOHASH_PRECISION = int(os.getenv("WEATHER_GEOHASH_PRECISION", 5))  # ~4.9 km cells
+    WEATHER_BUCKET_SECONDS = int(os.getenv("WEATHER_BUCKET_SECONDS", 3600))
+    WEATHER_STALE_SECONDS = int(os.getenv("WEATHER_STALE_SECONDS", 1800))
+    WEATHER_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", 2048))
+    # per-city TF-IDF models (set TFIDF_MODEL_DIR="" to fit per request instead)
+    TFIDF_MODEL_DIR = os.getenv("TFIDF_MODEL_DIR", ".cache/tfidf")
+    TFIDF_REFIT_RATIO = float(os.getenv("TFIDF_REFIT_RATIO", 0.3))  # refit once this share of docs changed
+    TFIDF_MAX_MODELS = int(os.getenv("TFIDF_MAX_MODELS", 32))  # models kept in memory
+    # weight of the exact preferred-kinds overlap added to the TF-IDF score
+    KINDS_MATCH_WEIGHT = float(os.getenv("KINDS_MATCH_WEIGHT", 0.2))
+    # catalog size from which recommend_pois shortlists candidates via the inverted index
+    RETRIEVAL_MIN_POIS = int(os.getenv("RETRIEVAL_MIN_POIS", 2000))
+    # collaborative filtering: plans are logged here (opt-in, e.g. ".cache/plan_log.jsonl"),
+    # `python cf_model.py train` writes CF_MODEL_DIR
+    PLAN_LOG_PATH = os.getenv("PLAN_LOG_PATH", "")  # "" disables logging
+    PLAN_LOG_MAX_BYTES = int(os.getenv("PLAN_LOG_MAX_BYTES", 50 * 1024 * 1024))  # rotate to <path>.1 past this (0 = never)
+    CF_MODEL_DIR = os.getenv("CF_MODEL_DIR", ".cache/cf")
+    CF_WEIGHT = float(os.getenv("CF_WEIGHT", 0.3))  # weight of the CF score next to TF-IDF
+    # travel times: average speed (km/h) per transport mode, WGS-84 ellipsoid vs sphere
+    TRAVEL_SPEEDS = _parse_map(os.getenv("TRAVEL_SPEEDS", "walking=5,driving=40"), float)
+    TRAVEL_ELLIPSOIDAL = os.getenv("TRAVEL_ELLIPSOIDAL", "1") not in ("0", "false", "False")
     # GA settings
     GA_POP_SIZE = int(os.getenv("GA_POP_SIZE", 40))
     GA_GENERATIONS = int(os.getenv("GA_GENERATIONS", 120))
-    GA_MUTATION_RATE = float(os.getenv("GA_MUTATION_RATE", 0.12))
\ No newline at end of file
+    GA_MUTATION_RATE = float(os.getenv("GA_MUTATION_RATE", 0.12))
+    # "serial" runs each day's GA in the request thread, "process" spreads days over a process pool
+    GA_EXECUTION = os.getenv("GA_EXECUTION", "serial")
+    GA_POOL_SIZE = int(os.getenv("GA_POOL_SIZE", 0))  # workers per server process (0 = CPU count)
+    # island model: >1 evolves that many populations per day, exchanging migrants
+    GA_ISLANDS = int(os.getenv("GA_ISLANDS", 1))
+    GA_MIGRATION_INTERVAL = int(os.getenv("GA_MIGRATION_INTERVAL", 10))  # generations between migrations
+    GA_MIGRANTS = int(os.getenv("GA_MIGRANTS", 2))  # individuals sent per route
+    GA_MIGRATION_TOPOLOGY = os.getenv("GA_MIGRATION_TOPOLOGY", "ring")  # ring | full | random
+    # early stopping: generations without a relative gain > GA_MIN_IMPROVEMENT (0 = run all generations)
+    GA_PATIENCE = int(os.getenv("GA_PATIENCE", 20))
+    GA_MIN_IMPROVEMENT = float(os.getenv("GA_MIN_IMPROVEMENT", 1e-4))
+    # wall-clock budget per plan request in seconds, from request start (0 = none);
+    # a payload "time_budget" overrides it, capped at GA_MAX_TIME_BUDGET
+    GA_TIME_BUDGET = float(os.getenv("GA_TIME_BUDGET", 0))
+    GA_MAX_TIME_BUDGET = float(os.getenv("GA_MAX_TIME_BUDGET", 10))
\ No newline at end of file
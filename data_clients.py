@@ -1,17 +1,819 @@
 import requests
-from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode, urlsplit, parse_qsl
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
+from spatial_index import SpatialIndex
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
 import time
+import unicodedata
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Process-wide requests.Session shared by all API clients, so TCP/TLS
+    connections are pooled and kept alive between calls.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=Config.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if not Config.HTTP_KEEP_ALIVE:
+                session.headers["Connection"] = "close"
+            _session = session
+    return _session
+
+
+def backoff_delay(attempt, headers=None):
+    # honour Retry-After when the server sends one, else exponential backoff with full jitter
+    retry_after = (headers or {}).get("Retry-After")
+    if retry_after:
+        try:
+            return min(float(retry_after), Config.HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    cap = min(Config.HTTP_BACKOFF_MAX, Config.HTTP_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+def _wake(waiter):
+    # runs on the waiter's own loop (scheduled from release() in any thread)
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket (`rate` requests/s, `burst` tokens) combined with an
+    AIMD concurrency limit. The number of requests in flight may not
+    exceed the current limit, which grows by `increase / limit` on every
+    healthy response (about +1 per round of requests) and is multiplied
+    by `decrease` on a 429 or a latency spike (a response slower than
+    both `spike_factor` times the smoothed baseline and `spike_floor`
+    seconds, so jitter on fast responses is not mistaken for one). Decreases happen at most
+    once per `cooldown` seconds so one burst of 429s counts once.
+    """
+
+    def __init__(self, name, rate, burst, max_concurrency, min_concurrency=1,
+                 increase=1.0, decrease=0.5, spike_factor=3.0, spike_floor=0.5, cooldown=1.0):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+        self.increase = increase
+        self.decrease = decrease
+        self.spike_factor = spike_factor
+        self.spike_floor = spike_floor
+        self.cooldown = cooldown
+        self.limit = float(self.max_concurrency)
+        self.tokens = self.burst
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.counters = {"requests": 0, "throttled": 0, "spikes": 0, "errors": 0, "decreases": 0, "wait_seconds": 0.0}
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters = []  # (loop, future) of acquire_async calls waiting for a slot
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def try_acquire(self):
+        """
+        Non-blocking acquire. Returns (True, 0.0) when a slot and a token
+        were taken, else (False, wait) where `wait` is the seconds until
+        the next token, or None if all concurrency slots are busy.
+        """
+        with self._cond:
+            return self._try_acquire_locked()
+
+    def _try_acquire_locked(self):
+        now = time.monotonic()
+        if self.in_flight >= int(self.limit):
+            return False, None  # wait for a release
+        self._refill(now)
+        if self.tokens < 1.0:
+            return False, (1.0 - self.tokens) / self.rate
+        self.tokens -= 1.0
+        self.in_flight += 1
+        self.counters["requests"] += 1
+        return True, 0.0
+
+    def acquire(self):
+        """Block until a request may be sent; returns the start timestamp for release()."""
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                ok, wait = self._try_acquire_locked()
+                if ok:
+                    break
+                self._cond.wait(wait)
+            now = time.monotonic()
+            self.counters["wait_seconds"] += now - started
+        return now
+
+    def release(self, started, status=None, error=False):
+        """Record the outcome of a request started at `started` (from acquire())."""
+        now = time.monotonic()
+        latency = now - started
+        with self._cond:
+            self.in_flight -= 1
+            spike = False
+            if status == 429:
+                self.counters["throttled"] += 1
+                self.tokens = min(self.tokens, 0.0)  # pause the bucket briefly
+            elif error:
+                self.counters["errors"] += 1
+            elif self.latency_ewma is not None and latency > max(self.spike_factor * self.latency_ewma,
+                                                                 self.spike_floor):
+                spike = True
+                self.counters["spikes"] += 1
+            if status == 429 or spike:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease)
+                    self._last_decrease = now
+                    self.counters["decreases"] += 1
+            elif not error:
+                self.limit = min(self.max_concurrency, self.limit + self.increase / max(self.limit, 1.0))
+            if not error and status != 429:
+                self.latency_ewma = latency if self.latency_ewma is None else 0.9 * self.latency_ewma + 0.1 * latency
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass  # that loop is closed
+
+    async def acquire_async(self):
+        """asyncio counterpart of acquire(); waits for a slot without blocking or polling the event loop."""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        while True:
+            with self._cond:
+                ok, wait = self._try_acquire_locked()
+                if not ok and wait is None:
+                    # all slots busy: registered under the lock, so the next release() cannot be missed
+                    waiter = loop.create_future()
+                    self._async_waiters.append((loop, waiter))
+            if ok:
+                break
+            if wait is None:
+                await waiter
+            else:
+                await asyncio.sleep(wait)
+        now = time.monotonic()
+        with self._cond:
+            self.counters["wait_seconds"] += now - started
+        return now
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                self.counters,
+                name=self.name,
+                rate=self.rate,
+                burst=self.burst,
+                concurrency_limit=round(self.limit, 2),
+                max_concurrency=self.max_concurrency,
+                in_flight=self.in_flight,
+                latency_ewma=self.latency_ewma,
+            )
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(endpoint):
+    """
+    Process-wide limiter for an endpoint named in Config.RATE_LIMITS
+    ("rate:burst"), or None when the endpoint has no quota configured.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(endpoint)
+        if limiter is None:
+            quota = Config.RATE_LIMITS.get(endpoint)
+            if not quota:
+                return None
+            rate, _, burst = quota.partition(":")
+            limiter = AdaptiveRateLimiter(
+                endpoint, float(rate), float(burst or rate),
+                max_concurrency=Config.RATE_MAX_CONCURRENCY,
+                min_concurrency=Config.RATE_MIN_CONCURRENCY,
+                spike_factor=Config.RATE_LATENCY_SPIKE_FACTOR,
+                spike_floor=Config.RATE_LATENCY_SPIKE_FLOOR,
+            )
+            _limiters[endpoint] = limiter
+    return limiter
+
+
+# query parameters that carry credentials; never written to fixtures
+SECRET_PARAMS = {"apikey", "appid", "username"}
+
+
+def _service_bases():
+    return {
+        "opentripmap": Config.OPENTRIPMAP_BASE,
+        "openweather": Config.OPENWEATHER_BASE,
+        "geonames": Config.GEONAMES_BASE,
+    }
+
+
+def fixture_key(service, path, query):
+    """
+    Stable fixture name for a request: service name, path relative to the
+    service base and the sorted query pairs without credentials.
+    Shared by the recorder below and replay_server.py.
+    """
+    pairs = sorted((k, str(v)) for k, v in query if k not in SECRET_PARAMS)
+    digest = hashlib.sha1(f"{service}|{path}|{urlencode(pairs)}".encode("utf-8")).hexdigest()
+    return f"{service}/{digest[:20]}"
+
+
+def record_fixture(url, status, content_type, body, record_dir):
+    """Save a response under `record_dir` so replay_server.py can serve it later."""
+    for service, base in _service_bases().items():
+        if url.startswith(base):
+            break
+    else:
+        return None
+    parts = urlsplit(url[len(base):])
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    name = fixture_key(service, parts.path, query)
+    path = os.path.join(record_dir, name + ".json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fixture = {
+        "service": service,
+        "path": parts.path,
+        "query": [[k, v] for k, v in query if k not in SECRET_PARAMS],
+        "status": status,
+        "content_type": content_type or "application/json",
+        "body": body,
+    }
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(fixture, fh)
+    return path
+
+
+def http_get(url, params=None, timeout=None, limiter=None, retries=None):
+    """
+    GET through the shared session. Transport errors (any
+    requests.RequestException raised by the session) and 429/5xx responses
+    are retried up to `retries` (default Config.HTTP_RETRIES) times; other HTTP errors are
+    raised immediately. Every attempt goes through `limiter` (an
+    AdaptiveRateLimiter) when one is given. Returns the response.
+    """
+    if timeout is None:
+        host = urlsplit(url).hostname
+        timeout = Config.HTTP_TIMEOUTS.get(host, Config.HTTP_TIMEOUT)
+    session = get_session()
+    if retries is None:
+        retries = Config.HTTP_RETRIES
+    for attempt in range(retries + 1):
+        started = limiter.acquire() if limiter is not None else None
+        resp = failure = None
+        try:
+            resp = session.get(url, params=params, timeout=timeout)
+        except requests.RequestException as e:
+            failure = e
+        finally:
+            # the slot goes back whatever session.get raised, or the limiter leaks it for good
+            if limiter is not None:
+                if resp is None:
+                    limiter.release(started, error=True)
+                else:
+                    limiter.release(started, status=resp.status_code, error=resp.status_code >= 500)
+        if failure is not None:
+            if attempt >= retries:
+                raise failure
+            time.sleep(backoff_delay(attempt))
+            continue
+        if resp.status_code in RETRY_STATUSES and attempt < retries:
+            time.sleep(backoff_delay(attempt, resp.headers))
+            continue
+        resp.raise_for_status()
+        if Config.HTTP_RECORD_DIR:
+            try:
+                body = resp.json()
+            except ValueError:
+                body = resp.text
+            record_fixture(resp.url, resp.status_code, resp.headers.get("Content-Type"), body, Config.HTTP_RECORD_DIR)
+        return resp
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls: while a call for `key` is in
+    flight, other threads asking for the same key wait for it and receive
+    the same result (or the same exception) instead of repeating the work.
+    Nothing is cached once the call finishes.
+    """
+
+    class _Call:
+        __slots__ = ("event", "result", "error")
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.executed = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"executed": self.executed, "shared": self.shared, "in_flight": in_flight}
+
+
+# process-wide in-flight deduplication for upstream API calls
+inflight = SingleFlight()
+
+
+class SQLiteCache:
+    """
+    Small persistent key/value cache on top of SQLite.
+    Entries expire after `ttl` seconds; once a namespace holds more than
+    `max_entries` rows the least recently used ones are evicted. A hit
+    refreshes the access time only when it is older than `touch_interval`
+    seconds, so reads do not turn into a write each.
+    Several namespaces can share one database file.
+    """
+
+    def __init__(self, path, namespace, ttl=None, max_entries=None, touch_interval=300):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL,"
+                " PRIMARY KEY (ns, key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (ns, accessed)")
+
+    def get(self, key):
+        """Return the cached value for `key`, or None if missing/expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created, accessed FROM cache WHERE ns = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created, accessed = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE ns = ? AND key = ?", (self.namespace, key))
+                self.misses += 1
+                return None
+            if now - accessed >= self.touch_interval:
+                # LRU order only needs touch_interval resolution
+                self._conn.execute(
+                    "UPDATE cache SET accessed = ? WHERE ns = ? AND key = ?",
+                    (now, self.namespace, key),
+                )
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (ns, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now),
+            )
+            if self.max_entries:
+                (count,) = self._conn.execute(
+                    "SELECT COUNT(*) FROM cache WHERE ns = ?", (self.namespace,)
+                ).fetchone()
+                excess = count - self.max_entries
+                if excess > 0:
+                    self._conn.execute(
+                        "DELETE FROM cache WHERE ns = ? AND key IN ("
+                        " SELECT key FROM cache WHERE ns = ? ORDER BY accessed ASC LIMIT ?)",
+                        (self.namespace, self.namespace, excess),
+                    )
+                    self.evictions += excess
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache WHERE ns = ?", (self.namespace,))
+
+    def stats(self):
+        with self._lock:
+            (size,) = self._conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE ns = ?", (self.namespace,)
+            ).fetchone()
+        return {
+            "namespace": self.namespace,
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(namespace, ttl=None, max_entries=None):
+    """
+    Process-wide SQLiteCache for `namespace`, or None when caching is
+    disabled. Caches are bypassed while recording fixtures (HTTP_RECORD_DIR),
+    so every upstream response is actually fetched and recorded.
+    """
+    if not Config.CACHE_DB_PATH or Config.HTTP_RECORD_DIR:
+        return None
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = SQLiteCache(Config.CACHE_DB_PATH, namespace, ttl=ttl, max_entries=max_entries,
+                                touch_interval=Config.CACHE_TOUCH_INTERVAL)
+            _caches[namespace] = cache
+    return cache
+
+
+def get_place_cache():
+    """Process-wide POI detail cache, or None when caching is disabled."""
+    return get_cache("otm_place_compact", ttl=Config.POI_CACHE_TTL, max_entries=Config.POI_CACHE_MAX_ENTRIES)
+
+
+def normalize_place_name(name):
+    """Case-, accent- and whitespace-insensitive key for place names ("São  Paulo" -> "sao paulo")."""
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+class Gazetteer:
+    """
+    In-memory index over a GeoNames cities dump (e.g. cities15000.txt from
+    https://download.geonames.org/export/dump/). Names are normalized with
+    normalize_place_name; when several places share a name the most
+    populous one wins. Keeps a sorted key list for prefix lookups.
+    """
+
+    def __init__(self, entries):
+        # entries: {normalized name: {"name", "lat", "lon", "country", "population"}}
+        self._entries = entries
+        self._keys = sorted(entries)
+
+    @classmethod
+    def load(cls, path, alternate_names=True):
+        entries = {}
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) < 15:
+                    continue
+                try:
+                    place = {
+                        "name": cols[1],
+                        "lat": float(cols[4]),
+                        "lon": float(cols[5]),
+                        "country": cols[8],
+                        "population": int(cols[14] or 0),
+                    }
+                except ValueError:
+                    continue
+                names = {cols[1], cols[2]}
+                if alternate_names and cols[3]:
+                    names.update(cols[3].split(","))
+                for n in names:
+                    key = normalize_place_name(n)
+                    if not key:
+                        continue
+                    current = entries.get(key)
+                    if current is None or place["population"] > current["population"]:
+                        entries[key] = place
+        return cls(entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, name):
+        return self._entries.get(normalize_place_name(name))
+
+    def search_prefix(self, prefix, limit=10):
+        """Places whose normalized name starts with `prefix`, most populous first."""
+        key = normalize_place_name(prefix)
+        if not key:
+            return []
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_left(self._keys, key + "\uffff")
+        matches = {}
+        for k in self._keys[lo:hi]:
+            place = self._entries[k]
+            matches[(place["name"], place["lat"], place["lon"])] = place
+        return sorted(matches.values(), key=lambda p: -p["population"])[:limit]
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Lazily loaded Gazetteer from Config.GEONAMES_GAZETTEER_PATH, or None."""
+    global _gazetteer
+    path = Config.GEONAMES_GAZETTEER_PATH
+    if not path or not os.path.exists(path):
+        return None
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            _gazetteer = Gazetteer.load(path, alternate_names=Config.GEONAMES_GAZETTEER_ALTNAMES)
+    return _gazetteer
+
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat, lon, precision=5):
+    """Standard base32 geohash of a point; precision 5 is a ~4.9 km x 4.9 km cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    lat, lon = float(lat), float(lon)
+    chars = []
+    bits = 0
+    ch = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch = (ch << 1) | 1
+                lon_lo = mid
+            else:
+                ch <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_BASE32[ch])
+            bits = 0
+            ch = 0
+    return "".join(chars)
+
+
+class WeatherCache:
+    """
+    In-memory cache for weather responses keyed by a coarse spatial cell.
+    An entry is fresh while it belongs to the current time bucket
+    (`bucket_seconds` wide). After that it is served stale for up to
+    `stale_seconds` while one background thread refreshes it
+    (stale-while-revalidate). On a miss, concurrent callers for the same
+    key wait for a single upstream call instead of issuing their own.
+    """
+
+    def __init__(self, bucket_seconds=3600, stale_seconds=1800, max_entries=2048):
+        self.bucket_seconds = bucket_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._entries = {}  # key -> (bucket, fetched_at, data)
+        self._inflight = SingleFlight()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _bucket(self, now):
+        return int(now // self.bucket_seconds)
+
+    def _store(self, key, data):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (self._bucket(now), now, data)
+            if len(self._entries) > self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                del self._entries[oldest]
+
+    def _refresh(self, key, loader):
+        try:
+            self._store(key, loader())
+        except Exception:
+            pass  # keep serving the stale entry; the next request retries
+        finally:
+            self.refresh_done(key)
+
+    def get(self, key, loader):
+        """Return cached data for `key`, calling `loader()` on a miss."""
+        state, data, refresh = self.lookup(key)
+        if refresh:
+            threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+        if state is not None:
+            return data
+        return self._inflight.do(key, lambda: self._load(key, loader))
+
+    def lookup(self, key):
+        """
+        Returns (state, data, refresh): state is "fresh", "stale" or None
+        (miss). `refresh` is True when the caller should revalidate a
+        stale entry and then call store() (or refresh_done() on failure).
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                bucket, fetched_at, data = entry
+                if bucket == self._bucket(now):
+                    self.hits += 1
+                    return "fresh", data, False
+                if now - fetched_at <= self.bucket_seconds + self.stale_seconds:
+                    self.stale_hits += 1
+                    refresh = key not in self._refreshing
+                    if refresh:
+                        self._refreshing.add(key)
+                        self.refreshes += 1
+                    return "stale", data, refresh
+            self.misses += 1
+        return None, None, False
+
+    def store(self, key, data):
+        self._store(key, data)
+        self.refresh_done(key)
+
+    def refresh_done(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _load(self, key, loader):
+        data = loader()
+        self._store(key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "size": size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+        }
+
+
+_weather_cache = None
+
+
+def get_weather_cache():
+    """Process-wide WeatherCache, or None when disabled in Config (or recording fixtures)."""
+    global _weather_cache
+    if not Config.WEATHER_CACHE_ENABLED or Config.HTTP_RECORD_DIR:
+        return None
+    with _caches_lock:
+        if _weather_cache is None:
+            _weather_cache = WeatherCache(
+                bucket_seconds=Config.WEATHER_BUCKET_SECONDS,
+                stale_seconds=Config.WEATHER_STALE_SECONDS,
+                max_entries=Config.WEATHER_CACHE_MAX_ENTRIES,
+            )
+    return _weather_cache
+
+
+_spatial_indexes = {}
+
+
+def get_spatial_index(kinds=None, rate=None):
+    """Process-wide SpatialIndex for one /radius kinds/rate filter, or None when disabled (or recording)."""
+    if not Config.SPATIAL_INDEX_ENABLED or Config.HTTP_RECORD_DIR:
+        return None
+    key = (kinds or "", "" if rate is None else str(rate))
+    with _caches_lock:
+        index = _spatial_indexes.get(key)
+        if index is None:
+            index = _spatial_indexes[key] = SpatialIndex(
+                cell_deg=Config.SPATIAL_INDEX_CELL_DEG,
+                ttl=Config.SPATIAL_INDEX_TTL,
+                max_features=Config.SPATIAL_INDEX_MAX_FEATURES,
+            )
+    return index
+
+
+def client_stats():
+    """Counters of the rate limiters and caches, for monitoring."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    with _caches_lock:
+        caches = list(_caches.values())
+        indexes = dict(_spatial_indexes)
+    weather = _weather_cache
+    return {
+        "rate_limiters": {l.name: l.stats() for l in limiters},
+        "caches": {c.namespace: c.stats() for c in caches},
+        "weather_cache": weather.stats() if weather is not None else None,
+        "spatial_index": {f"{k}|{r}": index.stats() for (k, r), index in indexes.items()},
+        "inflight": inflight.stats(),
+    }
+
 
 class OpenTripMapClient:
-    BASE = "https://api.opentripmap.com/0.1/en/places"
+    BASE = Config.OPENTRIPMAP_BASE
     KEY = Config.OPENTRIPMAP_KEY
 
     @staticmethod
     def radius_places(lat, lon, radius=2000, kinds=None, limit=50, rate=None):
         """
         Fetch list of POIs around coordinates using OpenTripMap /radius method.
+        With the spatial index enabled, areas fetched before are answered
+        in-process and only the uncovered part of the circle is requested.
         """
+        index = get_spatial_index(kinds, rate)
+        if index is None:
+            return OpenTripMapClient.radius_request(lat, lon, radius, kinds, limit, rate)
+        for f_lat, f_lon, f_radius in index.plan(lat, lon, radius, int(limit)):
+            resp = OpenTripMapClient.radius_request(f_lat, f_lon, f_radius, kinds, limit, rate)
+            if not isinstance(resp, dict):
+                return resp  # not GeoJSON, nothing to index
+            features = resp.get("features") or []
+            index.add(f_lat, f_lon, f_radius, features, complete=len(features) < int(limit))
+        return {"type": "FeatureCollection", "features": index.radius(lat, lon, radius, int(limit))}
+
+    @staticmethod
+    def radius_request(lat, lon, radius=2000, kinds=None, limit=50, rate=None):
+        """The /radius call itself (deduplicated and rate-limited, no spatial index)."""
+        url = OpenTripMapClient.radius_url(lat, lon, radius, kinds, limit, rate)
+
+        def load():
+            return http_get(url, limiter=get_rate_limiter("otm_radius")).json()
+
+        return inflight.do(("otm_radius", url), load)
+
+    @staticmethod
+    def radius_url(lat, lon, radius=2000, kinds=None, limit=50, rate=None):
         params = {
             "apikey": OpenTripMapClient.KEY,
             "radius": int(radius),
@@ -23,74 +825,231 @@ class OpenTripMapClient:
             params["kinds"] = kinds
         if rate is not None:
             params["rate"] = rate
-        url = f"{OpenTripMapClient.BASE}/radius?{urlencode(params)}"
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        return resp.json()
+        return f"{OpenTripMapClient.BASE}/radius?{urlencode(params)}"
 
     @staticmethod
-    def get_place(xid):
+    def get_place(xid, raw=False):
+        """
+        Details for one place, projected with project_place() and cached in
+        that compact form. raw=True returns the full payload, uncached.
+        """
         url = f"{OpenTripMapClient.BASE}/xid/{xid}?apikey={OpenTripMapClient.KEY}"
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        return resp.json()
+        if raw:
+            return inflight.do(("otm_xid_raw", xid), lambda: http_get(url, limiter=get_rate_limiter("otm_xid")).json())
+
+        cache = get_place_cache()
+        if cache is not None:
+            cached = cache.get(xid)
+            if cached is not None:
+                return cached
+
+        def load():
+            detail = project_place(http_get(url, limiter=get_rate_limiter("otm_xid")).json())
+            if cache is not None:
+                cache.set(xid, detail)
+            return detail
+
+        return inflight.do(("otm_xid", xid), load)
+
+    @staticmethod
+    def get_places(xids, max_concurrency=None):
+        """
+        Fetch details for many xids concurrently on a bounded thread pool.
+        Returns a list of (detail, error) tuples in the same order as `xids`;
+        exactly one of the two is None for each item.
+        """
+        xids = list(xids)
+        if not xids:
+            return []
+        workers = max(1, min(max_concurrency or Config.OTM_MAX_CONCURRENCY, len(xids)))
+
+        def fetch(xid):
+            try:
+                return OpenTripMapClient.get_place(xid), None
+            except Exception as e:
+                return None, e
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(fetch, xids))
+
+def _float_or_none(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def project_place(detail):
+    """
+    Keep only the fields the planner uses from an OpenTripMap /xid payload.
+    The wikipedia HTML, images, previews, address blocks etc. are dropped
+    and the description is flattened to plain text.
+    """
+    point = detail.get("point") or {}
+    description = (
+        (detail.get("wikipedia_extracts") or {}).get("text", "")
+        or (detail.get("info") or {}).get("descr", "")
+        or ""
+    )
+    return {
+        "xid": detail.get("xid"),
+        "name": detail.get("name") or "",
+        "kinds": detail.get("kinds", ""),
+        "lat": _float_or_none(point.get("lat")),
+        "lon": _float_or_none(point.get("lon")),
+        "rate": detail.get("rate"),
+        "description": description,
+    }
+
+
+def poi_from_detail(detail, feature=None):
+    """
+    Build the POI dict used by the recommender from a projected (or raw)
+    /xid payload plus its /radius feature, if any. Returns None for
+    unnamed places.
+    """
+    if "description" not in detail:
+        detail = project_place(detail)
+    if not detail.get("name"):
+        return None
+    feature = feature or {}
+    lat, lon = detail.get("lat"), detail.get("lon")
+    coords = feature.get("geometry", {}).get("coordinates")
+    if (lat is None or lon is None) and isinstance(coords, list) and len(coords) == 2:
+        lon, lat = _float_or_none(coords[0]), _float_or_none(coords[1])
+    poi = dict(detail, lat=lat or None, lon=lon or None)
+    dist = feature.get("properties", {}).get("dist")
+    if dist is not None:
+        poi["dist"] = float(dist)
+    return poi
 
 class OpenWeatherClient:
-    CURRENT = "https://api.openweathermap.org/data/2.5/weather"
-    FORECAST = "https://api.openweathermap.org/data/2.5/forecast"
-    ONECALL = "https://api.openweathermap.org/data/3.0/onecall"
+    CURRENT = f"{Config.OPENWEATHER_BASE}/2.5/weather"
+    FORECAST = f"{Config.OPENWEATHER_BASE}/2.5/forecast"
+    ONECALL = f"{Config.OPENWEATHER_BASE}/3.0/onecall"
 
     KEY = Config.OPENWEATHER_KEY
 
     @staticmethod
     def current_by_coords(lat, lon):
         params = {"lat": lat, "lon": lon, "appid": OpenWeatherClient.KEY, "units": "metric"}
-        resp = requests.get(OpenWeatherClient.CURRENT, params=params, timeout=10)
-        resp.raise_for_status()
+        resp = http_get(OpenWeatherClient.CURRENT, params=params)
         return resp.json()
 
     @staticmethod
     def forecast_by_coords(lat, lon):
         params = {"lat": lat, "lon": lon, "appid": OpenWeatherClient.KEY, "units": "metric"}
-        resp = requests.get(OpenWeatherClient.FORECAST, params=params, timeout=10)
-        resp.raise_for_status()
+        resp = http_get(OpenWeatherClient.FORECAST, params=params)
         return resp.json()
 
     @staticmethod
     def onecall(lat, lon, exclude=None):
+        """
+        One Call forecast. Responses are shared by all points in the same
+        geohash cell (Config.WEATHER_GEOHASH_PRECISION) within a time bucket.
+        """
+        def load():
+            resp = http_get(OpenWeatherClient.ONECALL, params=OpenWeatherClient.onecall_params(lat, lon, exclude))
+            return resp.json()
+
+        cache = get_weather_cache()
+        key = OpenWeatherClient.onecall_key(lat, lon, exclude, cache is not None)
+        if cache is None:
+            return inflight.do(key, load)
+        return cache.get(key, load)
+
+    @staticmethod
+    def onecall_params(lat, lon, exclude=None):
         params = {"lat": lat, "lon": lon, "appid": OpenWeatherClient.KEY, "units": "metric"}
         if exclude:
             params["exclude"] = ",".join(exclude)
-        resp = requests.get(OpenWeatherClient.ONECALL, params=params, timeout=10)
-        resp.raise_for_status()
-        return resp.json()
+        return params
+
+    @staticmethod
+    def onecall_key(lat, lon, exclude=None, by_cell=True):
+        """Dedup/cache key: the geohash cell when cached, else the exact point."""
+        excl = ",".join(sorted(exclude or []))
+        if by_cell:
+            return ("onecall", geohash_encode(lat, lon, Config.WEATHER_GEOHASH_PRECISION), excl)
+        return ("onecall", float(lat), float(lon), excl)
 
 class GeoNamesClient:
-    BASE = "http://api.geonames.org"
+    BASE = Config.GEONAMES_BASE
     USER = Config.GEONAMES_USERNAME
 
     @staticmethod
-    def search_place(name, maxRows=10):
+    def search_place(name, maxRows=10, timeout=None, retries=None):
         params = {"q": name, "maxRows": maxRows, "username": GeoNamesClient.USER}
-        resp = requests.get(f"{GeoNamesClient.BASE}/searchJSON", params=params, timeout=10)
-        resp.raise_for_status()
+        resp = http_get(f"{GeoNamesClient.BASE}/searchJSON", params=params, timeout=timeout, retries=retries)
         return resp.json()
 
     @staticmethod
     def reverse_geocode(lat, lon):
         params = {"lat": lat, "lng": lon, "username": GeoNamesClient.USER}
-        resp = requests.get(f"{GeoNamesClient.BASE}/findNearbyJSON", params=params, timeout=10)
-        resp.raise_for_status()
+        resp = http_get(f"{GeoNamesClient.BASE}/findNearbyJSON", params=params)
         return resp.json()
     
+    _coords = {}  # in-process memo: normalized name -> {"lat", "lon"}
+
+    @staticmethod
+    def get_coords(city, timeout=None, retries=None):
+        """
+        Resolve a city name to {"lat", "lon"} (floats), or {} if unknown.
+        Looks in the in-process memo, the offline gazetteer and the
+        persistent cache before calling GeoNames; with
+        Config.GEONAMES_OFFLINE set the network is never used.
+        timeout/retries override http_get's defaults for the GeoNames call.
+        """
+        key = normalize_place_name(city)
+        if not key:
+            return {}
+        coords = GeoNamesClient.local_coords(key)
+        if coords is None:
+            if Config.GEONAMES_OFFLINE:
+                return {}
+            resp = inflight.do(("geonames_search", key), lambda: GeoNamesClient.search_place(city, maxRows=1, timeout=timeout, retries=retries))
+            coords = GeoNamesClient.remember_coords(key, resp)
+        return dict(coords) if coords else {}
+
+    @staticmethod
+    def local_coords(key):
+        """
+        Coordinates for a normalized name from the memo, gazetteer or cache;
+        None if unknown (always None while recording fixtures, so the
+        GeoNames response is fetched and recorded).
+        """
+        if Config.HTTP_RECORD_DIR:
+            return None
+        coords = GeoNamesClient._coords.get(key)
+        if coords is not None:
+            return coords
+        gazetteer = get_gazetteer()
+        place = gazetteer.lookup(key) if gazetteer is not None else None
+        if place is not None:
+            coords = {"lat": place["lat"], "lon": place["lon"]}
+        else:
+            cache = get_cache("geocode", ttl=Config.GEOCODE_CACHE_TTL)
+            coords = cache.get(key) if cache is not None else None
+        if coords is not None:
+            GeoNamesClient._memo(key, coords)
+        return coords
+
+    @staticmethod
+    def remember_coords(key, resp):
+        """Store the first hit of a GeoNames searchJSON response; returns its coords or None."""
+        if not resp.get("geonames"):
+            return None
+        g = resp["geonames"][0]
+        coords = {"lat": float(g["lat"]), "lon": float(g["lng"])}
+        cache = get_cache("geocode", ttl=Config.GEOCODE_CACHE_TTL)
+        if cache is not None:
+            cache.set(key, coords)
+        GeoNamesClient._memo(key, coords)
+        return coords
+
     @staticmethod
-    def get_coords(city):
-        import requests
-        from config import Config
-        url = f"http://api.geonames.org/searchJSON?q={city}&maxRows=1&username={Config.GEONAMES_USERNAME}"
-        resp = requests.get(url).json()
-        if resp.get("geonames"):
-            g = resp["geonames"][0]
-            return {"lat": g["lat"], "lon": g["lng"]}
-        return {}
+    def _memo(key, coords):
+        if len(GeoNamesClient._coords) >= 10000:
+            GeoNamesClient._coords.clear()
+        GeoNamesClient._coords[key] = coords
 
@@ -0,0 +1,130 @@
+"""
+Declarative rule-based filtering for filter_pois.
+
+Each rule looks at the request (user profile + weather) once in
+compile(); if it applies it returns a predicate that maps a PoiTable to a
+boolean "keep" mask. compile_filters() combines the active predicates, so
+filtering is a handful of NumPy array ops however many POIs there are.
+New rules are added by subclassing FilterRule and calling register_rule().
+"""
+import numpy as np
+
+# exact OpenTripMap kind names (POIs also carry their parent categories)
+OUTDOOR_KINDS = ("natural", "beaches", "sport", "gardens_and_parks", "zoos")
+HOTEL_KINDS = ("hotels", "other_hotels", "love_hotels")
+
+
+class FilterContext:
+    """Request-level inputs, parsed once before any rule is compiled."""
+
+    def __init__(self, user_profile, weather_info=None):
+        self.user = user_profile or {}
+        self.weather = weather_info
+
+        # 🔧 Normalize budget to float
+        budget = self.user.get("budget_per_day")
+        try:
+            self.budget = float(budget) if budget is not None else None
+        except (ValueError, TypeError):
+            self.budget = None
+
+        self.rain_probability = 0.0
+        if weather_info:
+            try:
+                self.rain_probability = float(weather_info.get("daily", [])[0].get("pop", 0) or 0)
+            except Exception:
+                self.rain_probability = 0.0
+
+
+class FilterRule:
+    """Base class: compile(ctx) returns None (rule inactive) or a table -> keep-mask function."""
+    name = "rule"
+
+    def compile(self, ctx):
+        raise NotImplementedError
+
+
+class WeatherRule(FilterRule):
+    """Exclude outdoor places when heavy rain/storm is likely."""
+    name = "weather"
+
+    def __init__(self, max_rain_probability=0.6, outdoor_kinds=OUTDOOR_KINDS):
+        self.max_rain_probability = max_rain_probability
+        self.outdoor_kinds = tuple(outdoor_kinds)
+
+    def compile(self, ctx):
+        if ctx.rain_probability <= self.max_rain_probability:
+            return None
+        kinds = self.outdoor_kinds
+        return lambda table: ~table.kinds_any(kinds)
+
+
+class BudgetRule(FilterRule):
+    """Budget heuristic: no hotels below a minimum daily budget."""
+    name = "budget"
+
+    def __init__(self, min_hotel_budget=50.0, hotel_kinds=HOTEL_KINDS):
+        self.min_hotel_budget = min_hotel_budget
+        self.hotel_kinds = tuple(hotel_kinds)
+
+    def compile(self, ctx):
+        if ctx.budget is None or ctx.budget >= self.min_hotel_budget:
+            return None
+        kinds = self.hotel_kinds
+        return lambda table: ~table.kinds_any(kinds)
+
+
+class ExcludedKindsRule(FilterRule):
+    """Drop kinds the user asked to avoid (user_profile["exclude_kinds"], list or comma string)."""
+    name = "exclude_kinds"
+
+    def compile(self, ctx):
+        excluded = ctx.user.get("exclude_kinds") or []
+        if isinstance(excluded, str):
+            excluded = excluded.split(",")
+        excluded = tuple(k.strip() for k in excluded if k and k.strip())
+        if not excluded:
+            return None
+        return lambda table: ~table.kinds_any(excluded)
+
+
+class DistanceRule(FilterRule):
+    """Keep places within user_profile["max_distance"] metres of the centre (unknown distance passes)."""
+    name = "distance"
+
+    def compile(self, ctx):
+        try:
+            limit = float(ctx.user.get("max_distance"))
+        except (TypeError, ValueError):
+            return None
+        return lambda table: ~(table.dist > limit)
+
+
+RULES = [WeatherRule(), BudgetRule(), ExcludedKindsRule(), DistanceRule()]
+
+
+def register_rule(rule):
+    """Add a FilterRule instance to the default rule set."""
+    RULES.append(rule)
+    return rule
+
+
+class CompiledFilter:
+    def __init__(self, predicates):
+        self.predicates = predicates  # [(rule name, fn)]
+
+    def __call__(self, table):
+        mask = np.ones(len(table), dtype=bool)
+        for _, predicate in self.predicates:
+            mask &= predicate(table)
+        return mask
+
+
+def compile_filters(user_profile, weather_info=None, rules=None):
+    ctx = FilterContext(user_profile, weather_info)
+    predicates = []
+    for rule in RULES if rules is None else rules:
+        predicate = rule.compile(ctx)
+        if predicate is not None:
+            predicates.append((rule.name, predicate))
+    return CompiledFilter(predicates)
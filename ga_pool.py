@@ -0,0 +1,218 @@
+"""
+Runs the independent per-day ItineraryGA problems of a multi-day plan,
+optionally as an island model (IslandModel) per day.
+
+With Config.GA_EXECUTION = "process" the days are evolved in a
+persistent process pool (Config.GA_POOL_SIZE workers). Only the compact
+problem arrays (scores, travel-time block, day window, GA settings) go
+to the workers and only the best permutation comes back; the day plans
+are built in the calling process, in day order.
+
+The pool uses the "spawn" start method and is created lazily per
+process. A pool inherited through a fork (e.g. a pre-forking WSGI
+server) is never reused, and a broken pool is replaced. Under a
+multi-worker server every worker gets its own pool, so size GA_POOL_SIZE
+to roughly cores / workers.
+"""
+import atexit
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from config import Config
+from optimizer import ItineraryGA
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_pending = {}  # pool -> its not yet finished futures (cancelled when the pool is dropped)
+
+
+def _evolve(problem):
+    """Worker entry point: best chromosome for one day's problem."""
+    return ItineraryGA.from_problem(problem).evolve()
+
+
+def _evolve_island(problem, pop, generations, seed):
+    """Worker entry point: one island epoch (pop=None starts a random population)."""
+    ga = ItineraryGA.from_problem(problem, seed=seed)
+    return ga.evolve_population(ga.initial_pop() if pop is None else pop, generations)
+
+
+def get_pool():
+    """This process's GA pool, created on first use (and again after a fork)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            workers = Config.GA_POOL_SIZE or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _submit(pool, fn, *args):
+    future = pool.submit(fn, *args)
+    with _pool_lock:
+        _pending.setdefault(pool, set()).add(future)
+    future.add_done_callback(lambda f: _forget(pool, f))
+    return future
+
+
+def _forget(pool, future):
+    with _pool_lock:
+        _pending.get(pool, set()).discard(future)
+
+
+def _shutdown(pool):
+    """Cancel the pool's queued work and let it exit (shutdown(cancel_futures=) needs Python 3.9)."""
+    with _pool_lock:
+        futures = _pending.pop(pool, set())
+    for f in futures:
+        f.cancel()
+    pool.shutdown(wait=False)
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    _shutdown(pool)
+
+
+@atexit.register
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None and _pool_pid == os.getpid():
+        _shutdown(pool)
+
+
+class IslandModel:
+    """
+    Island-model GA for one day: `islands` populations of ga.pop_size evolve
+    independently (in the GA pool when GA_EXECUTION="process") and every
+    `migration_interval` generations each sends copies of its `migrants`
+    best individuals to its neighbours, where they replace the worst ones.
+    Topologies: "ring" (i -> i+1), "full" (everyone -> everyone, each island
+    keeps the best incoming), "random" (each island -> one random other).
+    """
+    TOPOLOGIES = ("ring", "full", "random")
+
+    def __init__(self, ga, islands=None, migration_interval=None, migrants=None, topology=None, seed=None):
+        self.ga = ga
+        self.islands = max(1, islands or Config.GA_ISLANDS)
+        self.migration_interval = max(1, migration_interval or Config.GA_MIGRATION_INTERVAL)
+        self.migrants = Config.GA_MIGRANTS if migrants is None else migrants
+        self.topology = topology or Config.GA_MIGRATION_TOPOLOGY
+        if self.topology not in self.TOPOLOGIES:
+            raise ValueError(f"unknown migration topology: {self.topology}")
+        self.rng = np.random.default_rng(seed)
+
+    def _routes(self):
+        n = self.islands
+        if self.topology == "ring":
+            return [(i, (i + 1) % n) for i in range(n)]
+        if self.topology == "full":
+            return [(i, j) for i in range(n) for j in range(n) if i != j]
+        return [(i, int((i + 1 + self.rng.integers(0, n - 1)) % n)) for i in range(n)]
+
+    def migrate(self, pops, fits):
+        """Copy each island's best individuals to its neighbours, replacing their worst (in place)."""
+        k = min(self.migrants, min(len(p) for p in pops))
+        if self.islands < 2 or k <= 0:
+            return
+        best = [np.argsort(-f, kind="stable")[:k] for f in fits]
+        incoming = {}
+        for src, dst in self._routes():
+            incoming.setdefault(dst, []).append((pops[src][best[src]].copy(), fits[src][best[src]].copy()))
+        for dst, parts in incoming.items():
+            cand = np.concatenate([p for p, _ in parts])
+            cand_fit = np.concatenate([f for _, f in parts])
+            keep = np.argsort(-cand_fit, kind="stable")[:k]
+            worst = np.argsort(fits[dst], kind="stable")[:len(keep)]
+            pops[dst][worst] = cand[keep]
+            fits[dst][worst] = cand_fit[keep]
+
+    def _epoch(self, problem, pops, generations):
+        seeds = [int(s) for s in self.rng.integers(0, 2 ** 63, self.islands)]
+        if Config.GA_EXECUTION == "process" and self.islands > 1:
+            pool = get_pool()
+            try:
+                futures = [_submit(pool, _evolve_island, problem, p, generations, s) for p, s in zip(pops, seeds)]
+                return [f.result() for f in futures]
+            except BrokenProcessPool:
+                _discard_pool(pool)
+        return [_evolve_island(problem, p, generations, s) for p, s in zip(pops, seeds)]
+
+    def evolve(self):
+        """
+        Best chromosome over all islands after ga.generations generations, or
+        earlier once the best over all islands stops improving for ga.patience
+        generations or ga.deadline passes.
+        """
+        problem = self.ga.problem()
+        pops = [None] * self.islands
+        best, best_fit = None, -np.inf
+        done = stale = 0
+        self.ga.stop_reason = "generations"
+        # bounded by epochs, not by finding a best: with undefined (NaN) fitnesses there may never be one
+        epochs = max(1, math.ceil(self.ga.generations / self.migration_interval))
+        for epoch in range(epochs):
+            if epoch and self.ga.deadline is not None and time.time() >= self.ga.deadline:
+                self.ga.stop_reason = "time_budget"
+                break
+            generations = min(self.migration_interval, max(self.ga.generations - done, 0))
+            results = self._epoch(problem, pops, generations)
+            done += generations
+            pops = [r[0] for r in results]
+            fits = [r[1] for r in results]
+            epoch_best, epoch_fit = max(((b, f) for _, _, b, f in results if b is not None),
+                                        key=lambda item: item[1], default=(None, -np.inf))
+            if epoch_best is not None and epoch_fit > best_fit:
+                stale = 0 if self.ga.improved(epoch_fit, None if best is None else best_fit) else stale + generations
+                best, best_fit = epoch_best, epoch_fit
+            else:
+                stale += generations
+            if self.ga.patience and stale >= self.ga.patience:
+                self.ga.stop_reason = "converged"
+                break
+            if done < self.ga.generations:
+                self.migrate(pops, fits)
+        self.ga.generations_run = done
+        if best is None:
+            # no island produced a comparable fitness: any individual is as good as another
+            best = pops[0][0].copy()
+        return best
+
+    def run(self):
+        return self.ga.build_daily_plan(self.evolve())
+
+
+def run_days(gas):
+    """Day plans of a list of ItineraryGA objects, in the same order."""
+    if Config.GA_ISLANDS > 1:
+        models = [IslandModel(ga) for ga in gas]
+        if Config.GA_EXECUTION == "process" and len(models) > 1:
+            # drive all days at once so their islands share the pool
+            with ThreadPoolExecutor(max_workers=len(models)) as threads:
+                return list(threads.map(IslandModel.run, models))
+        return [m.run() for m in models]
+    if Config.GA_EXECUTION != "process" or len(gas) < 2:
+        return [ga.run() for ga in gas]
+    pool = get_pool()
+    try:
+        futures = [_submit(pool, _evolve, ga.problem()) for ga in gas]
+        best = [f.result() for f in futures]
+    except BrokenProcessPool:
+        # a worker died: drop the pool (the next call starts a fresh one) and finish in-process
+        _discard_pool(pool)
+        return [ga.run() for ga in gas]
+    return [ga.build_daily_plan(b) for ga, b in zip(gas, best)]
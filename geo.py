@@ -0,0 +1,95 @@
+"""
+Vectorized great-circle helpers for array-at-a-time distance work, and the
+travel-time matrices the itinerary GA looks up by POI index instead of
+calling geopy's geodesic per pair.
+"""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088  # mean Earth radius (IUGG)
+WGS84_A_KM = 6378.137  # WGS-84 equatorial radius
+WGS84_F = 1 / 298.257223563  # WGS-84 flattening
+
+
+def _central_angle(lat1, lon1, lat2, lon2):
+    # haversine formula on radians, clipped against rounding just above 1
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; arguments broadcast like NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    return EARTH_RADIUS_KM * _central_angle(lat1, lon1, lat2, lon2)
+
+
+def lambert_km(lat1, lon1, lat2, lon2):
+    """
+    Distance on the WGS-84 ellipsoid by Lambert's formula (within a few tens
+    of metres of geopy's geodesic at city scale); arguments broadcast like
+    haversine_km.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    b1 = np.arctan((1 - WGS84_F) * np.tan(lat1))  # reduced latitudes
+    b2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    sigma = _central_angle(b1, lon1, b2, lon2)
+    p = (b1 + b2) / 2
+    q = (b2 - b1) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = (sigma - np.sin(sigma)) * np.sin(p) ** 2 * np.cos(q) ** 2 / np.cos(sigma / 2) ** 2
+        y = (sigma + np.sin(sigma)) * np.cos(p) ** 2 * np.sin(q) ** 2 / np.sin(sigma / 2) ** 2
+        d = WGS84_A_KM * (sigma - WGS84_F / 2 * (x + y))
+    return np.where(sigma == 0, 0.0, d)
+
+
+def distance_km(lat1, lon1, lat2, lon2, ellipsoidal=None):
+    """lambert_km or haversine_km (default: Config.TRAVEL_ELLIPSOIDAL)."""
+    if ellipsoidal is None:
+        from config import Config
+        ellipsoidal = Config.TRAVEL_ELLIPSOIDAL
+    return (lambert_km if ellipsoidal else haversine_km)(lat1, lon1, lat2, lon2)
+
+
+def distance_matrix_km(lats, lons, ellipsoidal=None):
+    """
+    N x N distances in km between points. Unknown coordinates give NaN
+    rows/columns, which callers must drop or penalize (ItineraryGA turns
+    them into day-long legs).
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    return distance_km(lats[:, None], lons[:, None], lats[None, :], lons[None, :], ellipsoidal)
+
+
+def speed_kmh(mode):
+    """Average speed for a transport mode (Config.TRAVEL_SPEEDS, walking speed for unknown modes)."""
+    from config import Config
+    speeds = Config.TRAVEL_SPEEDS
+    return speeds.get(mode) or speeds.get("walking", 5.0)
+
+
+class TravelTimeMatrix:
+    """
+    Pairwise travel times between a fixed list of points. Distances are
+    computed once, vectorized; minutes(mode) divides them by the mode's
+    speed and is cached per mode.
+    """
+
+    def __init__(self, lats, lons, ellipsoidal=None):
+        self.km = distance_matrix_km(lats, lons, ellipsoidal)
+        self._minutes = {}
+
+    @classmethod
+    def from_pois(cls, pois, ellipsoidal=None):
+        return cls([p.get("lat") for p in pois], [p.get("lon") for p in pois], ellipsoidal)
+
+    def __len__(self):
+        return len(self.km)
+
+    def minutes(self, mode="walking"):
+        """N x N float64 travel minutes for `mode` (read-only)."""
+        out = self._minutes.get(mode)
+        if out is None:
+            out = self.km / speed_kmh(mode) * 60
+            out.setflags(write=False)
+            self._minutes[mode] = out
+        return out
@@ -0,0 +1,118 @@
+"""
+Kinds taxonomy index: every distinct OpenTripMap kind gets a bit, and a
+POI's comma-separated `kinds` string becomes a bitset stored as a row of
+uint64 words. Kind filters and preference matching are then exact
+bitwise ops instead of substring scans ("hotel" in kinds also matched
+unrelated kinds).
+"""
+import threading
+
+import numpy as np
+
+WORD_BITS = 64
+
+
+def split_kinds(kinds):
+    if isinstance(kinds, str):
+        kinds = kinds.split(",")
+    return [k.strip() for k in kinds or [] if k and k.strip()]
+
+
+def popcount(words):
+    """Number of set bits per row of a 2-D uint64 word array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1).astype(np.int64)
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1).sum(axis=-1).astype(np.int64)
+
+
+class KindsVocabulary:
+    """
+    Grows as new kinds are seen; bit positions never change, so bitsets
+    encoded earlier stay valid (they are just narrower - see fit_width).
+    Encodings of whole kinds strings are memoized, so re-encoding the same
+    POIs costs a dict lookup.
+    """
+
+    def __init__(self):
+        self.bit_of = {}
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.bit_of)
+
+    @property
+    def n_words(self):
+        return max(1, -(-len(self.bit_of) // WORD_BITS))
+
+    def _bits(self, kinds, grow):
+        bits = 0
+        for k in split_kinds(kinds):
+            b = self.bit_of.get(k)
+            if b is None:
+                if not grow:
+                    continue
+                b = self.bit_of[k] = len(self.bit_of)
+            bits |= 1 << b
+        return bits
+
+    def encode(self, kinds, grow=True):
+        """Python int bitset of a kinds string or list; unknown kinds are added when `grow`."""
+        if isinstance(kinds, str):
+            bits = self._memo.get(kinds)
+            if bits is not None:
+                return bits
+        with self._lock:
+            bits = self._bits(kinds, grow)
+            if isinstance(kinds, str) and grow:
+                self._memo[kinds] = bits
+        return bits
+
+    def to_words(self, bits_list, n_words=None):
+        """Pack Python int bitsets into an (n, n_words) uint64 array."""
+        n_words = n_words or self.n_words
+        out = np.zeros((len(bits_list), n_words), dtype=np.uint64)
+        mask = (1 << WORD_BITS) - 1
+        for i, bits in enumerate(bits_list):
+            w = 0
+            while bits and w < n_words:
+                out[i, w] = bits & mask
+                bits >>= WORD_BITS
+                w += 1
+        return out
+
+    def encode_many(self, kinds_list):
+        """(n, n_words) uint64 bitsets for a sequence of kinds strings."""
+        bits = [self.encode(k) for k in kinds_list]
+        return self.to_words(bits)
+
+    def mask(self, kinds, n_words):
+        """(n_words,) uint64 query mask for `kinds`; kinds never seen match nothing."""
+        return self.to_words([self.encode(kinds, grow=False)], n_words)[0]
+
+
+# process-wide vocabulary shared by all tables
+KINDS = KindsVocabulary()
+
+
+def fit_width(words, n_words):
+    """`words` zero-padded (or cut) to `n_words` columns, for stacking bitsets encoded at different times."""
+    if words.shape[1] == n_words:
+        return words
+    out = np.zeros((len(words), n_words), dtype=np.uint64)
+    n = min(n_words, words.shape[1])
+    out[:, :n] = words[:, :n]
+    return out
+
+
+def has_any(words, query):
+    """Rows of `words` sharing at least one bit with `query` (both uint64, same width)."""
+    return (words & query).any(axis=1)
+
+
+def overlap_ratio(words, query):
+    """Share of the query's kinds present in each row (0 when the query is empty)."""
+    total = int(popcount(query[None, :])[0])
+    if total == 0:
+        return np.zeros(len(words), dtype=np.float64)
+    return popcount(words & query) / total
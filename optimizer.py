@@ -1,128 +1,233 @@
-import random
 import math
-from recommender import travel_time_minutes
-from copy import deepcopy
+import time
+import numpy as np
+from geo import TravelTimeMatrix
 import datetime
 
 class ItineraryGA:
-    def __init__(self, poi_list, user_profile, pop_size=40, generations=100, mutation_rate=0.12):
+    def __init__(self, poi_list, user_profile, pop_size=40, generations=100, mutation_rate=0.12,
+                 travel_minutes=None, seed=None, scores=None,
+                 patience=None, min_improvement=0.0, deadline=None):
         """
         poi_list: list of POI dicts (with lat/lon and opening hours if available)
         user_profile: { start_time: "09:00", end_time: "18:00", days: 1, transport: 'walking' }
+        travel_minutes: optional N x N travel-time matrix aligned with poi_list
+                        (e.g. a slice of a plan-wide geo.TravelTimeMatrix); built here otherwise
+        seed: optional seed for the GA's random generator
+        scores: optional per-POI scores (default: each POI's 'score', else 1)
+        patience: stop after this many generations without improvement (None = never)
+        min_improvement: relative gain of the best fitness below which a generation counts as no improvement
+        deadline: time.time() after which evolution stops; the best individual so far is returned
+
+        Chromosomes are integer permutations of range(N) over the read-only
+        POI table, and a population is a (pop_size, N) matrix of them, so each
+        GA step is a handful of array ops for the whole generation. POI dicts
+        are only materialized in build_daily_plan.
         """
-        self.pois = poi_list
+        self.pois = tuple(poi_list)
         self.user = user_profile
         self.pop_size = pop_size
         self.generations = generations
         self.mutation_rate = mutation_rate
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.deadline = deadline
+        self.generations_run = 0
+        self.stop_reason = None
+        if travel_minutes is None:
+            travel_minutes = TravelTimeMatrix.from_pois(poi_list).minutes(user_profile.get("transport", "walking"))
+        if scores is None:
+            scores = [p.get("score", 1.0) for p in self.pois]
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.n = len(self.scores)
+        self.gene_dtype = np.int16 if self.n <= np.iinfo(np.int16).max else np.int32
+        self.rng = np.random.default_rng(seed)
+        # day window, parsed once
+        self.start = datetime.datetime.strptime(self.user.get("start_time","09:00"), "%H:%M")
+        self.end = datetime.datetime.strptime(self.user.get("end_time","18:00"), "%H:%M")
+        # available minutes in day
+        self.available = (self.end - self.start).seconds / 60.0
+        travel = np.asarray(travel_minutes, dtype=np.float64)
+        unknown = np.isnan(travel)
+        # POIs without coordinates (NaN rows): never planned, and their legs cost a whole day
+        self.unroutable = unknown.all(axis=1) if travel.size else np.zeros(self.n, dtype=bool)
+        if unknown.any():
+            travel = np.where(unknown, max(self.available, 1.0), travel)
+        self.travel = travel
+
+    def problem(self):
+        """
+        The GA inputs as compact arrays and scalars (no POI dicts), e.g. to
+        evolve in another process; ItineraryGA.from_problem() rebuilds it.
+        """
+        return {
+            "scores": self.scores,
+            "travel": np.ascontiguousarray(self.travel),
+            "start_time": self.user.get("start_time", "09:00"),
+            "end_time": self.user.get("end_time", "18:00"),
+            "pop_size": self.pop_size,
+            "generations": self.generations,
+            "mutation_rate": self.mutation_rate,
+            "patience": self.patience,
+            "min_improvement": self.min_improvement,
+            "deadline": self.deadline,
+        }
+
+    @classmethod
+    def from_problem(cls, problem, seed=None):
+        user = {"start_time": problem["start_time"], "end_time": problem["end_time"]}
+        return cls([], user, problem["pop_size"], problem["generations"], problem["mutation_rate"],
+                   travel_minutes=problem["travel"], seed=seed, scores=problem["scores"],
+                   patience=problem.get("patience"), min_improvement=problem.get("min_improvement", 0.0),
+                   deadline=problem.get("deadline"))
 
     def random_chromosome(self):
-        chrom = deepcopy(self.pois)
-        random.shuffle(chrom)
-        return chrom
+        return self.rng.permutation(self.n).astype(self.gene_dtype)
 
     def initial_pop(self):
-        return [self.random_chromosome() for _ in range(self.pop_size)]
+        """(pop_size, N) matrix, one random permutation per row."""
+        return np.argsort(self.rng.random((self.pop_size, self.n)), axis=1).astype(self.gene_dtype)
 
-    def fitness(self, chrom):
+    def fitness(self, pop):
+        """Fitness of every row of a (P, N) population (a single chromosome gives a 0-d result)."""
+        pop = np.asarray(pop)
         # Objective: maximize sum of poi scores, penalize travel time > available
-        total_score = 0.0
-        total_travel = 0.0
         # sum poi 'score' if present else 1
-        prev = None
-        for p in chrom:
-            total_score += p.get("score", 1.0)
-            if prev is not None:
-                t = travel_time_minutes(prev["lat"], prev["lon"], p["lat"], p["lon"], self.user.get("transport","walking"))
-                total_travel += t
-            prev = p
-        # available minutes in day
-        start = datetime.datetime.strptime(self.user.get("start_time","09:00"), "%H:%M")
-        end = datetime.datetime.strptime(self.user.get("end_time","18:00"), "%H:%M")
-        available = (end - start).seconds / 60.0
-        # simple penalty
-        penalty = 0.0
-        if total_travel > available * 0.6:  # e.g., if travel too much
-            penalty += (total_travel - available * 0.6) / available
+        total_score = self.scores[pop].sum(axis=-1)
+        # travel between consecutive stops: one gather over the precomputed matrix
+        total_travel = self.travel[pop[..., :-1], pop[..., 1:]].sum(axis=-1)
+        # simple penalty, if travel too much
+        available = self.available
+        penalty = np.maximum(total_travel - available * 0.6, 0.0) / available if available else 0.0
         # combine: high score better, less travel better
-        fitness_value = total_score - penalty * 5.0 - (total_travel / 60.0) * 0.1
-        return fitness_value
-
-    def select(self, population, fitnesses):
-        # tournament selection
-        selected = []
-        for _ in range(len(population)):
-            a,b = random.sample(range(len(population)), 2)
-            winner = population[a] if fitnesses[a] > fitnesses[b] else population[b]
-            selected.append(winner)
-        return selected
-
-    def crossover(self, parent1, parent2):
-        # ordered crossover (OX)
-        size = len(parent1)
+        return total_score - penalty * 5.0 - (total_travel / 60.0) * 0.1
+
+    def select(self, pop, fitnesses):
+        # tournament selection between two distinct random individuals per slot
+        n = len(pop)
+        if n < 2:
+            return pop.copy()
+        a = self.rng.integers(0, n, n)
+        b = self.rng.integers(0, n - 1, n)
+        b += b >= a
+        return pop[np.where(fitnesses[a] > fitnesses[b], a, b)]
+
+    def crossover(self, parents1, parents2):
+        """
+        Ordered crossover (OX) of matching rows of two (P, N) parent matrices:
+        each child keeps parents1[a:b] in place and fills the remaining
+        positions, from b onwards (wrapping), with parents2's genes in order
+        starting at b. Visited masks replace membership scans, O(P*N) overall.
+        """
+        rows, size = parents1.shape
         if size < 2:
-            return deepcopy(parent1)
-        a, b = sorted(random.sample(range(size), 2))
-        child = [None]*size
-        child[a:b] = parent1[a:b]
-        fill_pos = b
-        for g in parent2[b:] + parent2[:b]:
-            if g not in child:
-                if fill_pos >= size: fill_pos = 0
-                child[fill_pos] = g
-                fill_pos += 1
-        # fix any None (edge-case)
-        for i in range(size):
-            if child[i] is None:
-                for cand in parent1:
-                    if cand not in child:
-                        child[i] = cand
-                        break
+            return parents1.copy()
+        a = self.rng.integers(0, size, rows)
+        b = self.rng.integers(0, size - 1, rows)
+        b += b >= a
+        a, b = np.minimum(a, b), np.maximum(a, b)
+        pos = np.arange(size)
+        in_slice = (pos >= a[:, None]) & (pos < b[:, None])
+        child = np.empty_like(parents1)
+        child[in_slice] = parents1[in_slice]
+        r, c = np.nonzero(in_slice)
+        visited = np.zeros((rows, size), dtype=bool)
+        visited[r, parents1[r, c]] = True
+        # parents2 rotated to start at b; its unvisited genes go to positions b, b+1, ... (mod size)
+        order = np.take_along_axis(parents2, (b[:, None] + pos) % size, axis=1)
+        keep = ~np.take_along_axis(visited, order.astype(np.intp), axis=1)
+        slot = np.cumsum(keep, axis=1) - 1
+        r, c = np.nonzero(keep)
+        child[r, (b[r] + slot[r, c]) % size] = order[r, c]
         return child
 
-    def mutate(self, chrom):
-        # swap mutation
-        size = len(chrom)
-        if random.random() < self.mutation_rate:
-            i,j = random.sample(range(size),2)
-            chrom[i], chrom[j] = chrom[j], chrom[i]
+    def mutate(self, pop):
+        # swap mutation, in place, for a random subset of rows
+        rows, size = pop.shape
+        if size < 2:
+            return
+        hit = np.flatnonzero(self.rng.random(rows) < self.mutation_rate)
+        i = self.rng.integers(0, size, len(hit))
+        j = self.rng.integers(0, size - 1, len(hit))
+        j += j >= i
+        pop[hit, i], pop[hit, j] = pop[hit, j], pop[hit, i]
 
     def run(self):
-        pop = self.initial_pop()
+        # After GA, build a simple day plan by time accounting
+        return self.build_daily_plan(self.evolve())
+
+    def evolve(self):
+        """Run the GA and return the best chromosome (an index permutation)."""
+        _, _, best, _ = self.evolve_population(self.initial_pop(), self.generations)
+        return best
+
+    def improved(self, new, old):
+        """Whether best fitness `new` beats `old` by more than the relative min_improvement."""
+        return old is None or new - old > self.min_improvement * max(abs(old), 1e-12)
+
+    def evolve_population(self, pop, generations):
+        """
+        Evolve `pop` for up to `generations` generations. Returns (final
+        population, its fitnesses, best chromosome seen, best fitness), so a
+        caller (e.g. the island model) can continue from where it stopped.
+        Anytime: stops early once `patience` generations pass without
+        improvement or the deadline passes, and still returns the best so far.
+        """
         best = None
         best_score = -1e9
-        for gen in range(self.generations):
-            fitnesses = [self.fitness(c) for c in pop]
-            for i,fv in enumerate(fitnesses):
-                if fv > best_score:
-                    best_score = fv
-                    best = deepcopy(pop[i])
+        stale = 0
+        self.generations_run = 0
+        self.stop_reason = "generations"
+        fitnesses = None
+        for gen in range(generations):
+            if self.deadline is not None and time.time() >= self.deadline:
+                self.stop_reason = "time_budget"
+                break
+            fitnesses = self.fitness(pop)
+            i = int(np.argmax(fitnesses))
+            if fitnesses[i] > best_score:
+                stale = 0 if self.improved(fitnesses[i], None if best is None else best_score) else stale + 1
+                best_score = fitnesses[i]
+                best = pop[i].copy()
+            else:
+                stale += 1
+            if self.patience and stale >= self.patience:
+                self.stop_reason = "converged"
+                break
             # selection
             selected = self.select(pop, fitnesses)
-            # crossover to produce new pop
-            new_pop = []
-            for i in range(0, len(selected), 2):
-                p1 = selected[i]
-                p2 = selected[(i+1) % len(selected)]
-                child1 = self.crossover(p1, p2)
-                child2 = self.crossover(p2, p1)
-                self.mutate(child1)
-                self.mutate(child2)
-                new_pop.extend([child1, child2])
-            pop = new_pop[:self.pop_size]
-        # After GA, build a simple day plan by time accounting
-        itinerary = self.build_daily_plan(best)
-        return itinerary
+            # crossover to produce new pop: pairs (0,1), (2,3), ... give two children each
+            p1 = selected[0::2]
+            p2 = selected[(np.arange(0, len(selected), 2) + 1) % len(selected)]
+            children = np.empty((2 * len(p1), pop.shape[1]), dtype=pop.dtype)
+            children[0::2] = self.crossover(p1, p2)
+            children[1::2] = self.crossover(p2, p1)
+            self.mutate(children)
+            pop = children[:self.pop_size]
+            fitnesses = None
+            self.generations_run += 1
+        if fitnesses is None:
+            # the last bred generation (or the initial one) has not been scored yet
+            fitnesses = self.fitness(pop)
+            i = int(np.argmax(fitnesses))
+            if fitnesses[i] > best_score:
+                best_score = fitnesses[i]
+                best = pop[i].copy()
+        if best is None:
+            # no comparable fitness (e.g. NaN scores): any individual is as good as another
+            best = pop[0].copy()
+        return pop, fitnesses, best, float(best_score)
 
     def build_daily_plan(self, chrom):
-        start = datetime.datetime.strptime(self.user.get("start_time","09:00"), "%H:%M")
-        end = datetime.datetime.strptime(self.user.get("end_time","18:00"), "%H:%M")
-        current_time = start
+        end = self.end
+        current_time = self.start
         plan = []
         prev = None
-        for p in chrom:
-            if prev:
-                tt = travel_time_minutes(prev["lat"], prev["lon"], p["lat"], p["lon"], self.user.get("transport","walking"))
+        for i in chrom:
+            if self.unroutable[i]:
+                continue
+            if prev is not None:
+                tt = float(self.travel[prev, i])
             else:
                 tt = 0
             arrival = current_time + datetime.timedelta(minutes=tt)
@@ -131,11 +236,7 @@ class ItineraryGA:
             if finish > end:
                 break
 
-            poi_copy = deepcopy(p)  # ✅ keep all original fields
-            poi_copy.update({
-                "arrival": arrival.strftime("%H:%M"),
-                "departure": finish.strftime("%H:%M"),
-            })
+            p = self.pois[i]  # only the POIs that make it into the plan are turned back into dicts
             plan.append({
                 "xid": p["xid"],
                 "name": p["name"],
@@ -147,5 +248,5 @@ class ItineraryGA:
             })
 
             current_time = finish
-            prev = p
+            prev = i
         return plan
\ No newline at end of file
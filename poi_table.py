@@ -0,0 +1,48 @@
+"""
+Columnar view over a list of POI dicts, so filters and scoring can work on
+NumPy arrays instead of looping over dicts.
+"""
+import numpy as np
+
+from kinds_index import KINDS, has_any
+
+
+def _float_column(values):
+    out = np.full(len(values), np.nan, dtype=np.float64)
+    for i, v in enumerate(values):
+        try:
+            if v not in (None, ""):
+                out[i] = float(v)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+class PoiTable:
+    """
+    One array per field, row i describing pois[i]:
+      xid, name  - object arrays
+      kind_bits  - (n, words) uint64 kinds bitsets, see kinds_index
+      lat, lon   - float64, NaN when unknown
+      dist       - float64 distance from the search centre in metres, NaN when unknown
+    """
+
+    def __init__(self, pois):
+        self.pois = list(pois)
+        self.xid = np.array([p.get("xid") for p in self.pois], dtype=object)
+        self.name = np.array([p.get("name") or "" for p in self.pois], dtype=object)
+        self.lat = _float_column([p.get("lat") for p in self.pois])
+        self.lon = _float_column([p.get("lon") for p in self.pois])
+        self.dist = _float_column([p.get("dist") for p in self.pois])
+        self.kind_bits = KINDS.encode_many(p.get("kinds") or "" for p in self.pois)
+
+    def __len__(self):
+        return len(self.pois)
+
+    def kinds_any(self, kinds):
+        """Boolean mask of rows tagged with at least one of `kinds` (exact kind names)."""
+        return has_any(self.kind_bits, KINDS.mask(kinds, self.kind_bits.shape[1]))
+
+    def select(self, mask):
+        """POI dicts of the rows where `mask` is True, in order."""
+        return [self.pois[i] for i in np.flatnonzero(mask)]
@@ -8,8 +8,7 @@ import re
 import os
 import json
 
-# ✅ Import central config (loads .env variables)
-from config import Config
+from data_clients import GeoNamesClient
 
 FLASK_URL = os.getenv("SMART_TOURISM_BACKEND", "http://localhost:5000/api/plan")
 
@@ -87,17 +86,14 @@ class ActionPlanTrip(Action):
                 else:
                     interests = []
 
-        # If city provided but no coords, we'll try GeoNames
+        # If city provided but no coords, we'll try GeoNames (cached / offline gazetteer first)
         if city and not (lat and lon):
             try:
-                if Config.GEONAMES_USERNAME:   # ✅ use config.py
-                    params = {"q": city, "maxRows": 1, "username": Config.GEONAMES_USERNAME}
-                    r = requests.get("http://api.geonames.org/searchJSON", params=params, timeout=6)
-                    data = r.json()
-                    if data.get("geonames"):
-                        g = data["geonames"][0]
-                        lat = float(g["lat"])
-                        lon = float(g["lng"])
+                # the user is waiting in the chat: one short attempt, no retries
+                coords = GeoNamesClient.get_coords(city, timeout=6, retries=0)
+                if coords:
+                    lat = coords["lat"]
+                    lon = coords["lon"]
             except Exception:
                 pass
 
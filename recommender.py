@@ -3,8 +3,16 @@ import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import linear_kernel
 from data_clients import OpenTripMapClient, OpenWeatherClient
-from geopy.distance import geodesic
+from tfidf_store import get_store as get_tfidf_store, poi_document, poi_description
+from poi_table import PoiTable
+from filter_rules import compile_filters
+from kinds_index import KINDS, split_kinds, overlap_ratio, popcount
+from retrieval import TermIndex
+from cf_model import get_model as get_cf_model
+from geo import haversine_km, distance_km, speed_kmh
+from config import Config
 import datetime
+import re
 
 # Preference & Rule-based filtering
 def filter_pois(pois, user_profile, weather_info=None):
@@ -12,49 +20,63 @@ def filter_pois(pois, user_profile, weather_info=None):
     pois: list of dicts (from OpenTripMap)
     user_profile: dict {interests: [..], budget_per_day: float, mobility: 'car'/'walking' }
     weather_info: optional weather data from OpenWeather onecall
+
+    The rules in filter_rules.RULES (weather, budget, excluded kinds, distance)
+    are compiled once for this request and applied as array masks.
     """
+    if not pois:
+        return []
+    table = PoiTable(pois)
+    keep = compile_filters(user_profile, weather_info)(table)
+    return table.select(keep)
 
-    # 🔧 Normalize budget to float
-    budget = user_profile.get("budget_per_day")
-    try:
-        budget = float(budget) if budget is not None else None
-    except (ValueError, TypeError):
-        budget = None
 
-    filtered = []
-    for p in pois:
-        kind = p.get("kinds", "")
-        name = p.get("name", "")
-        dist = p.get("dist", 0)
+# Phase-one pre-rank on /radius features (no detail calls needed)
+def _stems(text):
+    # crude stemming so "culture"/"cultural" or "museum"/"museums" match
+    return {t[:6] for t in re.split(r"[^a-z0-9]+", (text or "").lower()) if len(t) > 2}
 
-        # Example: exclude outdoor in heavy rain/storm
-        if weather_info:
-            try:
-                pop = weather_info.get("daily", [])[0].get("pop", 0)
-            except Exception:
-                pop = 0
-            outdoor_kinds = ["natural", "beaches", "sport", "garden", "zoo"]
-            if pop > 0.6 and any(o in kind for o in outdoor_kinds):
-                continue
 
-        # Budget heuristic
-        if budget is not None:
-            if "hotel" in kind and budget < 50:
-                continue
+def _feature_rate(props):
+    # OpenTripMap rates: 0-3, heritage ones as "1h"-"3h" (5-7 in GeoJSON output)
+    m = re.match(r"\d+", str(props.get("rate") or 0))
+    return min(int(m.group(0)), 7) if m else 0
 
-        filtered.append(p)
-    return filtered
+
+def prerank_features(features, user_profile, top_k=None, radius=None):
+    """
+    Rank raw /radius features using only what they already carry (name,
+    kinds, rate, dist) and keep the best `top_k` (all when falsy).
+    Returns [(xid, feature), ...], best first; unnamed features are dropped.
+    """
+    user_stems = _stems(" ".join(user_profile.get("interests", [])) + " " + user_profile.get("preferred_kinds", ""))
+    scored = []
+    for i, item in enumerate(features):
+        props = item.get("properties", {})
+        xid = props.get("xid") or item.get("id")
+        if not xid or not props.get("name"):
+            continue
+        text = 0.0
+        if user_stems:
+            feat_stems = _stems(props.get("name", "") + " " + props.get("kinds", ""))
+            text = len(user_stems & feat_stems) / len(user_stems)
+        rate = _feature_rate(props) / 7.0
+        dist = 0.0
+        if radius:
+            dist = 1.0 - min(float(props.get("dist") or 0.0), radius) / radius
+        score = text + 0.5 * rate + 0.25 * dist
+        scored.append((-score, i, xid, item))
+    scored.sort(key=lambda s: (s[0], s[1]))
+    if top_k:
+        scored = scored[:top_k]
+    return [(xid, item) for _, _, xid, item in scored]
 
 
 # Content-based scoring using description + kinds + name
 def build_poi_dataframe(pois):
     rows = []
     for p in pois:
-        desc = (
-            p.get("wikipedia_extracts", {}).get("text", "")
-            or p.get("info", {}).get("descr", "")
-            or ""
-        )
+        desc = poi_description(p)
         kinds = p.get("kinds", "")
 
         # ✅ Prefer normalized lat/lon if available
@@ -68,35 +90,230 @@ def build_poi_dataframe(pois):
             "lon": lon,
             "kinds": kinds,
             "description": desc,
-            "raw": p   # keep full POI reference
         })
     return pd.DataFrame(rows)
 
 
-def recommend_pois(filtered_pois, user_profile, top_n=12):
+def user_document(user_profile):
+    """The user's 'pseudo-document': interests + preferred kinds."""
+    return " ".join(user_profile.get("interests", [])) + " " + user_profile.get("preferred_kinds", "")
+
+
+def _poi_corpus(pois, city=None):
+    """
+    (X, rows, transform, index, kind_bits): X[rows] are the TF-IDF rows of
+    `pois`, transform maps query documents into the same space, index()
+    returns the TermIndex over X and kind_bits are the kinds bitsets of
+    `pois`. Uses the persisted per-city model when `city` is
+    given and the store is enabled, else fits one. With the store, all of
+    them come from one model snapshot (so concurrent updates of the city
+    cannot mix them) and only new or edited POIs are vectorized or encoded.
+    """
+    store = get_tfidf_store() if city else None
+    if store is not None and all(p.get("xid") for p in pois):
+        model, rows = store.model_for(city, pois)
+        return model.X, rows, model.transform, lambda: model.index, model.kind_bits[rows]
+    vectorizer = TfidfVectorizer(max_features=1500, stop_words="english")
+    X = vectorizer.fit_transform([poi_document(p) for p in pois])
+    kind_bits = KINDS.encode_many(p.get("kinds") or "" for p in pois)
+    return X, np.arange(len(pois)), vectorizer.transform, lambda: TermIndex(X), kind_bits
+
+
+def poi_matrix(pois, city=None):
+    """TF-IDF rows for `pois` (CSR, one row per POI) plus the query transform."""
+    X, rows, transform, _, _ = _poi_corpus(pois, city)
+    return X[rows], transform
+
+
+def cf_scores(pois, profiles):
+    """
+    (profiles, pois) collaborative-filtering scores in [0, 1] from the
+    offline-trained model (zero rows for users it cannot place), or None
+    when CF is off, untrained or knows none of the users.
+    """
+    model = get_cf_model() if Config.CF_WEIGHT else None
+    if model is None:
+        return None
+    U = np.zeros((len(profiles), model.item_factors.shape[1]), dtype=np.float32)
+    known = False
+    for i, profile in enumerate(profiles):
+        u = model.user_vector(profile.get("user_id"), profile.get("history"))
+        if u is not None:
+            U[i] = u
+            known = True
+    if not known:
+        return None
+    return np.clip(U @ model.item_matrix([p.get("xid") for p in pois]).T, 0.0, 1.0)
+
+
+def within_radius(pois, lat, lon, radius_m):
+    """Boolean mask of POIs within `radius_m` metres of (lat, lon); unknown coordinates pass."""
+    coords = np.array([
+        [p.get("lat") or (p.get("point") or {}).get("lat") or np.nan,
+         p.get("lon") or (p.get("point") or {}).get("lon") or np.nan] for p in pois
+    ], dtype=np.float64).reshape(-1, 2)
+    dist_m = haversine_km(lat, lon, coords[:, 0], coords[:, 1]) * 1000
+    return ~(dist_m > radius_m)
+
+
+def _kind_lists(kind_bits, rows, preferred):
+    """Preferred kinds as (index rows, weight) lists, matching kinds_boost."""
+    if not Config.KINDS_MATCH_WEIGHT:
+        return []
+    bits = sorted({KINDS.bit_of[k] for k in split_kinds(preferred) if k in KINDS.bit_of})
+    bits = [b for b in bits if b // 64 < kind_bits.shape[1]]
+    lists = []
+    for b in bits:
+        has = (kind_bits[:, b // 64] >> np.uint64(b % 64)) & np.uint64(1)
+        lists.append((rows[has.astype(bool)], Config.KINDS_MATCH_WEIGHT / len(bits)))
+    return lists
+
+
+def _shortlist(index, rows, up_vec, kind_bits, preferred, top_n, allowed):
+    """Positions (into pois) that can make the top-N, via the inverted index."""
+    allowed_rows = np.zeros(index.n_docs, dtype=bool)
+    allowed_rows[rows[allowed]] = True
+    found, _ = index.search(up_vec, top_n, allowed_rows, _kind_lists(kind_bits, rows, preferred))
+    position_of = np.full(index.n_docs, -1, dtype=np.int64)
+    position_of[rows] = np.arange(len(rows))
+    positions = np.sort(position_of[found])
+    if len(positions) < top_n:
+        # too few POIs share a term with the query: pad with zero-score POIs in input order
+        rest = np.flatnonzero(allowed)
+        rest = rest[~np.isin(rest, positions)][:top_n - len(positions)]
+        positions = np.sort(np.concatenate([positions, rest]))
+    return positions
+
+
+def kinds_boost(kind_bits, preferred):
+    """Exact preferred-kinds overlap (bitset feature block), weighted by Config.KINDS_MATCH_WEIGHT."""
+    if not Config.KINDS_MATCH_WEIGHT or not split_kinds(preferred):
+        return None
+    return Config.KINDS_MATCH_WEIGHT * overlap_ratio(kind_bits, KINDS.mask(preferred, kind_bits.shape[1]))
+
+
+def top_n_indices(scores, top_n):
+    """Indices of the `top_n` highest scores, best first (ties keep input order)."""
+    n = len(scores)
+    k = min(top_n, n)
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    if k < n:
+        # everything tied with the k-th score, so ties at the cut-off also resolve by position
+        kth = np.partition(scores, n - k)[n - k]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(n)
+    return candidates[np.lexsort((candidates, -scores[candidates]))][:k]
+
+
+def recommendation_record(p, score):
+    """Lightweight result row (same keys build_poi_dataframe exposes, plus score)."""
+    return {
+        "xid": p.get("xid"),
+        "name": p.get("name"),
+        "lat": p.get("lat") or (p.get("point") or {}).get("lat"),
+        "lon": p.get("lon") or (p.get("point") or {}).get("lon"),
+        "kinds": p.get("kinds", ""),
+        "description": poi_description(p),
+        "score": float(score),
+    }
+
+
+def recommend_pois(filtered_pois, user_profile, top_n=12, city=None, near=None):
     """
     content-based: combine name + kinds + description, TF-IDF and cosine with user 'pseudo-document'
+    city: optional corpus key; when given (and the model store is enabled) the
+          persisted per-city TF-IDF model is reused instead of fitting a new one
+    near: optional (lat, lon, radius_m) spatial pre-filter
+    From Config.RETRIEVAL_MIN_POIS POIs on, an inverted index shortlists
+    candidates first; exact cosine (linear_kernel) is computed on the
+    shortlist only and the top-N is picked with argpartition.
+    When a CF model knows the user (user_profile["user_id"] / ["history"]),
+    its scores are blended in with weight Config.CF_WEIGHT.
+    build_poi_dataframe remains available for analysis.
     """
-    df = build_poi_dataframe(filtered_pois)
-    if df.empty:
+    pois = list(filtered_pois)
+    if not pois:
         return []
-    docs = (df["name"].fillna("") + " " + df["kinds"].fillna("") + " " + df["description"].fillna("")).tolist()
-    vectorizer = TfidfVectorizer(max_features=1500, stop_words="english")
-    X = vectorizer.fit_transform(docs)
-    # Create user profile document
-    up_doc = " ".join(user_profile.get("interests", [])) + " " + user_profile.get("preferred_kinds", "")
-    up_vec = vectorizer.transform([up_doc])
-    cosine_sim = linear_kernel(up_vec, X).flatten()
-    df["score"] = cosine_sim
-    df = df.sort_values("score", ascending=False)
-    return df.head(top_n).to_dict(orient="records")
+    X, rows, transform, index, kind_bits = _poi_corpus(pois, city)
+    up_vec = transform([user_document(user_profile)])
+    preferred = user_profile.get("preferred_kinds", "")
+    allowed = within_radius(pois, *near) if near else np.ones(len(pois), dtype=bool)
+    cf = cf_scores(pois, [user_profile])
+
+    # the shortlist only bounds text + kinds scores, so CF-blended requests score every POI
+    if cf is None and len(pois) >= Config.RETRIEVAL_MIN_POIS and len(np.unique(rows)) == len(rows):
+        positions = _shortlist(index(), rows, up_vec, kind_bits, preferred, top_n, allowed)
+    else:
+        positions = np.flatnonzero(allowed)
+    if not len(positions):
+        return []
+    scores = linear_kernel(up_vec, X[rows[positions]]).ravel().astype(np.float64)
+    # exact preferred-kinds match as a bitset feature block on top of the text similarity
+    boost = kinds_boost(kind_bits[positions], preferred)
+    if boost is not None:
+        scores += boost
+    if cf is not None:
+        scores += Config.CF_WEIGHT * cf[0, positions]
+    return [recommendation_record(pois[positions[i]], scores[i]) for i in top_n_indices(scores, top_n)]
+
+
+def recommend_pois_batch(pois, profiles, top_n=12, city=None, chunk_size=256):
+    """
+    recommend_pois for many user profiles over the same POIs: the POI
+    matrix is built once, all profile documents are transformed together
+    and scored with one sparse product per chunk of `chunk_size` profiles
+    (which bounds the dense score block). Returns one top-N list per profile.
+    """
+    pois = list(pois)
+    profiles = list(profiles)
+    if not pois or not profiles:
+        return [[] for _ in profiles]
+    X, rows, transform, _, kind_bits = _poi_corpus(pois, city)
+    X = X[rows]
+    U = transform([user_document(p) for p in profiles])
+    preferred = [p.get("preferred_kinds", "") for p in profiles]
+    cf = cf_scores(pois, profiles)
+    XT = X.T.tocsr()
+    k = min(top_n, len(pois))
+    results = []
+    for start in range(0, len(profiles), chunk_size):
+        stop = min(start + chunk_size, len(profiles))
+        scores = np.asarray((U[start:stop] @ XT).todense(), dtype=np.float64)
+        if Config.KINDS_MATCH_WEIGHT:
+            masks = KINDS.to_words([KINDS.encode(kinds, grow=False) for kinds in preferred[start:stop]],
+                                   kind_bits.shape[1])
+            totals = popcount(masks)
+            if totals.any():
+                hits = popcount((kind_bits[None, :, :] & masks[:, None, :]).reshape(-1, kind_bits.shape[1]))
+                hits = hits.reshape(len(masks), len(pois))
+                scores += Config.KINDS_MATCH_WEIGHT * hits / np.maximum(totals, 1)[:, None]
+        if cf is not None:
+            scores += Config.CF_WEIGHT * cf[start:stop]
+        if k <= 0:
+            results.extend([] for _ in range(start, stop))
+            continue
+        # row-wise argpartition, then a stable best-first order inside each row
+        if k < len(pois):
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(len(pois)), scores.shape)
+        values = np.take_along_axis(scores, candidates, axis=1)
+        order = np.lexsort((candidates, -values), axis=-1)
+        top = np.take_along_axis(candidates, order, axis=1)
+        top_scores = np.take_along_axis(values, order, axis=1)
+        # rows with ties straddling the cut-off are redone so ties resolve by position, as in recommend_pois
+        straddling = np.flatnonzero((scores >= top_scores[:, -1:]).sum(axis=1) > k)
+        for j in straddling:
+            top[j] = top_n_indices(scores[j], k)
+            top_scores[j] = scores[j, top[j]]
+        for row, row_scores in zip(top, top_scores):
+            results.append([recommendation_record(pois[i], s) for i, s in zip(row, row_scores)])
+    return results
 
 # Utility
 def travel_time_minutes(a_lat, a_lon, b_lat, b_lon, mode="walking"):
-    # naive: geodesic distance / speed
-    dist_km = geodesic((a_lat, a_lon), (b_lat, b_lon)).km
-    if mode == "driving":
-        speed_kmh = 40
-    else:
-        speed_kmh = 5
-    return (dist_km / speed_kmh) * 60
\ No newline at end of file
+    # naive: ellipsoidal distance / speed (geo.TravelTimeMatrix does all pairs at once)
+    dist_km = float(distance_km(a_lat, a_lon, b_lat, b_lon))
+    return (dist_km / speed_kmh(mode)) * 60
\ No newline at end of file
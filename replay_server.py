@@ -0,0 +1,141 @@
+"""
+Local stand-in for the OpenTripMap, OpenWeather and GeoNames APIs.
+
+Serves fixtures recorded by data_clients (run the app once with
+HTTP_RECORD_DIR=fixtures against the real APIs), with optional injected
+latency, jitter and error rates, so the planner can be benchmarked and
+load-tested offline with reproducible numbers.
+
+    python replay_server.py --fixtures fixtures --port 8765 --latency 80 --jitter 30 --error-rate 0.02
+
+then point the clients at it, e.g. in .env:
+
+    OPENTRIPMAP_BASE=http://127.0.0.1:8765/opentripmap
+    OPENWEATHER_BASE=http://127.0.0.1:8765/openweather
+    GEONAMES_BASE=http://127.0.0.1:8765/geonames
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+from data_clients import fixture_key
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    server_version = "IRSReplay/1.0"
+
+    def do_GET(self):
+        srv = self.server
+        with srv.stats_lock:
+            srv.stats["requests"] += 1
+        delay = max(0.0, srv.latency + srv.rng_uniform(-srv.jitter, srv.jitter))
+        if delay:
+            time.sleep(delay)
+
+        roll = srv.rng_uniform(0.0, 1.0)
+        if roll < srv.throttle_rate:
+            return self._send(429, {"error": "injected rate limit"}, headers={"Retry-After": "1"}, stat="throttled")
+        if roll < srv.throttle_rate + srv.error_rate:
+            return self._send(srv.error_status, {"error": "injected failure"}, stat="errors")
+
+        parts = urlsplit(self.path)
+        service, _, rel_path = parts.path.lstrip("/").partition("/")
+        name = fixture_key(service, "/" + rel_path, parse_qsl(parts.query, keep_blank_values=True))
+        fixture = srv.fixtures.get(name)
+        if fixture is None:
+            return self._send(404, {"error": "no fixture recorded", "fixture": name}, stat="missing")
+        body = fixture["body"]
+        payload = body if isinstance(body, str) else json.dumps(body)
+        self._send(fixture.get("status", 200), payload, content_type=fixture.get("content_type"), stat="hits")
+
+    def _send(self, status, body, headers=None, content_type=None, stat=None):
+        if stat:
+            with self.server.stats_lock:
+                self.server.stats[stat] += 1
+        data = (body if isinstance(body, str) else json.dumps(body)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type or "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        if not self.server.quiet:
+            super().log_message(fmt, *args)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fixtures_dir, latency=0.0, jitter=0.0, error_rate=0.0,
+                 throttle_rate=0.0, error_status=503, seed=None, quiet=True):
+        super().__init__(address, ReplayHandler)
+        self.fixtures = load_fixtures(fixtures_dir)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.error_status = error_status
+        self.quiet = quiet
+        self.stats = {"requests": 0, "hits": 0, "missing": 0, "errors": 0, "throttled": 0}
+        self.stats_lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def rng_uniform(self, a, b):
+        with self._rng_lock:
+            return self._rng.uniform(a, b)
+
+
+def load_fixtures(fixtures_dir):
+    fixtures = {}
+    for root, _, files in os.walk(fixtures_dir):
+        for fn in files:
+            if not fn.endswith(".json"):
+                continue
+            path = os.path.join(root, fn)
+            name = os.path.relpath(path, fixtures_dir)[:-len(".json")].replace(os.sep, "/")
+            with open(path, encoding="utf-8") as fh:
+                fixtures[name] = json.load(fh)
+    return fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default="fixtures")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean added latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform +/- jitter in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = ReplayServer(
+        (args.host, args.port), args.fixtures,
+        latency=args.latency / 1000.0, jitter=args.jitter / 1000.0,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+        error_status=args.error_status, seed=args.seed, quiet=not args.verbose,
+    )
+    print(f"Replaying {len(server.fixtures)} fixtures on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats))
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Candidate retrieval for recommend_pois over large POI catalogs.
+
+TermIndex keeps the TF-IDF matrix column-wise (one posting list per term)
+together with each term's maximum weight. search() walks the query's
+posting lists MaxScore-style: lists are visited by decreasing score upper
+bound, and once the upper bounds left can no longer lift an unseen POI
+past the current k-th best partial score, the remaining lists only update
+POIs already seen. Preferred kinds take part as extra constant-weight
+lists, so the kinds-overlap feature is pruned the same way. The returned
+shortlist is then scored exactly (linear_kernel) by the caller.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+
+class TermIndex:
+    """Posting lists of a CSR TF-IDF matrix (rows = POIs, columns = terms)."""
+
+    def __init__(self, X):
+        X = sp.csr_matrix(X)
+        self.n_docs = X.shape[0]
+        csc = X.tocsc()
+        csc.sort_indices()
+        self.indptr = csc.indptr
+        self.indices = csc.indices
+        self.data = csc.data
+        lengths = np.diff(self.indptr)
+        self.max_weight = np.zeros(X.shape[1], dtype=np.float64)
+        nonempty = lengths > 0
+        if nonempty.any():
+            self.max_weight[nonempty] = np.maximum.reduceat(self.data, self.indptr[:-1][nonempty])
+
+    def postings(self, term):
+        start, end = self.indptr[term], self.indptr[term + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def search(self, query, k, allowed=None, extra=()):
+        """
+        Rows that can make the top-k of `query` (a 1 x terms sparse vector).
+        allowed: optional boolean mask over rows (e.g. the filtered POIs);
+        extra: (rows, weight) lists added on top of the text score.
+        Returns (rows, partial scores), best first; POIs scoring 0 are not returned.
+        """
+        q = sp.csr_matrix(query)
+        lists = []
+        for term, w in zip(q.indices, q.data):
+            rows, weights = self.postings(term)
+            if len(rows):
+                lists.append((float(w) * self.max_weight[term], rows, float(w) * weights))
+        for rows, weight in extra:
+            if len(rows) and weight > 0:
+                lists.append((weight, np.asarray(rows), np.full(len(rows), weight)))
+        if not lists or k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+        lists.sort(key=lambda item: -item[0])
+        remaining = np.cumsum([ub for ub, _, _ in lists][::-1])[::-1]
+
+        acc = np.zeros(self.n_docs, dtype=np.float64)
+        seen = np.zeros(self.n_docs, dtype=bool)
+        n_seen = 0
+        theta = 0.0
+        for i, (_, rows, contrib) in enumerate(lists):
+            if allowed is not None:
+                keep = allowed[rows]
+                rows, contrib = rows[keep], contrib[keep]
+            if n_seen >= k and remaining[i] < theta:
+                # non-essential list: an unseen row could reach at most remaining[i] < theta
+                keep = seen[rows]
+                rows, contrib = rows[keep], contrib[keep]
+            else:
+                n_seen += int(np.count_nonzero(~seen[rows]))
+                seen[rows] = True
+            acc[rows] += contrib
+            if n_seen >= k:
+                theta = float(np.partition(acc[seen], n_seen - k)[n_seen - k])
+
+        candidates = np.flatnonzero(seen)
+        scores = acc[candidates]
+        if len(candidates) > k:
+            # keep near-ties at the cut-off; the caller rescores exactly
+            keep = scores >= theta - 1e-6
+            candidates, scores = candidates[keep], scores[keep]
+        order = np.lexsort((candidates, -scores))
+        return candidates[order], scores[order]
@@ -0,0 +1,240 @@
+"""
+In-process spatial index over the POI features returned by OpenTripMap
+/radius queries.
+
+Features are bucketed in a lat/lon grid. The index also remembers which
+grid cells earlier queries covered (within a TTL), so a radius query
+that falls inside covered cells is answered locally. For a query that
+is only partly covered, plan() returns small circles around the
+uncovered cells, and only those are fetched from the network.
+"""
+import math
+import threading
+import time
+
+import numpy as np
+
+from geo import haversine_km
+
+KM_PER_DEG_LAT = 111.32
+
+
+def feature_coords(feature):
+    coords = (feature.get("geometry") or {}).get("coordinates") or [None, None]
+    point = feature.get("point") or {}
+    lon = coords[0] if coords[0] is not None else point.get("lon")
+    lat = coords[1] if coords[1] is not None else point.get("lat")
+    return lat, lon
+
+
+def feature_xid(feature):
+    return (feature.get("properties") or {}).get("xid") or feature.get("xid")
+
+
+class SpatialIndex:
+    """
+    Grid of `cell_deg` x `cell_deg` degree buckets holding GeoJSON features
+    (one index per kinds/rate filter, since /radius results depend on it).
+    """
+
+    def __init__(self, cell_deg=0.01, ttl=24 * 3600, max_features=200000):
+        self.cell_deg = cell_deg
+        self.ttl = ttl
+        self.max_features = max_features
+        self.cells = {}  # (row, col) -> {xid: feature}
+        self.cell_of = {}  # xid -> (row, col)
+        self.covered = {}  # (row, col) -> expiry timestamp
+        self.circles = []  # [(lat, lon, radius_km, expiry)] fetched areas, newest last
+        self.max_circles = 256
+        self.hits = 0
+        self.partial = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.cell_of)
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def _cells_near(self, lat, lon, radius_km):
+        """Cells intersecting the bounding box of a circle."""
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlon = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        r0, c0 = self._cell(lat - dlat, lon - dlon)
+        r1, c1 = self._cell(lat + dlat, lon + dlon)
+        return [(r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+    def _corners(self, cells):
+        cells = np.asarray(cells, dtype=np.float64).reshape(-1, 2)
+        lat0, lon0 = cells[:, 0] * self.cell_deg, cells[:, 1] * self.cell_deg
+        lats = np.stack([lat0, lat0, lat0 + self.cell_deg, lat0 + self.cell_deg], axis=1)
+        lons = np.stack([lon0, lon0 + self.cell_deg, lon0, lon0 + self.cell_deg], axis=1)
+        return lats, lons
+
+    def _cells_inside(self, lat, lon, radius_km):
+        """Cells lying entirely within the circle."""
+        cells = self._cells_near(lat, lon, radius_km)
+        lats, lons = self._corners(cells)
+        inside = (haversine_km(lat, lon, lats, lons) <= radius_km).all(axis=1)
+        return [cell for cell, ok in zip(cells, inside) if ok]
+
+    def _cells_touching(self, lat, lon, radius_km):
+        """Cells sharing any area with the circle (nearest point of the cell within the radius)."""
+        cells = self._cells_near(lat, lon, radius_km)
+        cells_arr = np.asarray(cells, dtype=np.float64).reshape(-1, 2)
+        near_lat = np.clip(lat, cells_arr[:, 0] * self.cell_deg, (cells_arr[:, 0] + 1) * self.cell_deg)
+        near_lon = np.clip(lon, cells_arr[:, 1] * self.cell_deg, (cells_arr[:, 1] + 1) * self.cell_deg)
+        touching = haversine_km(lat, lon, near_lat, near_lon) <= radius_km
+        return [cell for cell, ok in zip(cells, touching) if ok]
+
+    def _bounding_circle(self, cells):
+        lats, lons = self._corners(cells)
+        c_lat = float(lats.min() + lats.max()) / 2
+        c_lon = float(lons.min() + lons.max()) / 2
+        r_m = math.ceil(float(haversine_km(c_lat, c_lon, lats, lons).max()) * 1000)  # /radius takes whole metres
+        return c_lat, c_lon, r_m
+
+    def plan(self, lat, lon, radius_m, limit=None):
+        """
+        Circles [(lat, lon, radius_m)] still to fetch for this query: [] when
+        it is fully covered, or when it asks for at most `limit` features
+        and a covered disk around its centre already holds that many (the
+        nearest `limit` are then known exactly). Otherwise circles around
+        the uncovered cells (one, or one per quadrant when that is smaller),
+        or the query itself when those would not be smaller.
+        """
+        now = time.time()
+        radius_km = radius_m / 1000
+        with self._lock:
+            self.circles = [c for c in self.circles if c[3] > now]
+            # radius of the largest fetched disk centred on the query point
+            covered_km = max((c_r - float(haversine_km(lat, lon, c_lat, c_lon))
+                              for c_lat, c_lon, c_r, _ in self.circles), default=0.0)
+            inside = covered_km >= radius_km
+            if not inside and limit and covered_km > 0:
+                feats, coords = self._candidates(self._cells_touching(lat, lon, covered_km))
+                if len(feats) >= limit:
+                    dist_km = haversine_km(lat, lon, coords[:, 0], coords[:, 1])
+                    inside = int(np.count_nonzero(dist_km <= covered_km)) >= limit
+            missing = [] if inside else [c for c in self._cells_touching(lat, lon, radius_km)
+                                         if self.covered.get(c, 0) <= now]
+            if not missing:
+                self.hits += 1
+                return []
+            circle = self._bounding_circle(missing)
+            if circle[2] < radius_m:
+                self.partial += 1
+                return [circle]
+            # a crescent left by an overlapping query: try one circle per quadrant
+            cells = np.asarray(missing)
+            mid_r = (cells[:, 0].min() + cells[:, 0].max()) / 2
+            mid_c = (cells[:, 1].min() + cells[:, 1].max()) / 2
+            quadrants = {}
+            for cell in missing:
+                quadrants.setdefault((cell[0] <= mid_r, cell[1] <= mid_c), []).append(cell)
+            circles = [self._bounding_circle(q) for q in quadrants.values()]
+            if len(circles) > 1 and sum(r * r for _, _, r in circles) < radius_m * radius_m:
+                self.partial += 1
+                return circles
+            self.misses += 1
+            return [(lat, lon, radius_m)]
+
+    def add(self, lat, lon, radius_m, features, complete=True):
+        """
+        Insert features fetched for a circle and mark its cells covered.
+        When the response was truncated by `limit` (complete=False) only the
+        disc out to the farthest returned feature counts as covered.
+        """
+        now = time.time()
+        with self._lock:
+            far_km = 0.0
+            for f in features:
+                xid = feature_xid(f)
+                f_lat, f_lon = feature_coords(f)
+                if not xid or f_lat is None or f_lon is None:
+                    continue
+                far_km = max(far_km, float(haversine_km(lat, lon, f_lat, f_lon)))
+                old = self.cell_of.get(xid)
+                if old is not None:
+                    self.cells.get(old, {}).pop(xid, None)
+                cell = self._cell(float(f_lat), float(f_lon))
+                self.cells.setdefault(cell, {})[xid] = f
+                self.cell_of[xid] = cell
+            covered_km = radius_m / 1000 if complete else far_km
+            for cell in self._cells_inside(lat, lon, covered_km):
+                self.covered[cell] = now + self.ttl
+            self.circles.append((lat, lon, covered_km, now + self.ttl))
+            del self.circles[:-self.max_circles]
+            if len(self.cell_of) > self.max_features:
+                self._evict(now)
+
+    def _evict(self, now):
+        # drop expired coverage and the features of cells no longer covered
+        self.covered = {c: t for c, t in self.covered.items() if t > now}
+        self.circles = [c for c in self.circles if c[3] > now]
+        for cell in [c for c in self.cells if c not in self.covered]:
+            for xid in self.cells.pop(cell):
+                self.cell_of.pop(xid, None)
+        if len(self.cell_of) > self.max_features:
+            self.cells.clear()
+            self.cell_of.clear()
+            self.covered.clear()
+            self.circles.clear()
+
+    def _candidates(self, cells):
+        feats = [f for c in cells for f in self.cells.get(c, {}).values()]
+        coords = np.array([feature_coords(f) for f in feats], dtype=np.float64).reshape(-1, 2)
+        return feats, coords
+
+    @staticmethod
+    def _with_dist(feature, dist_m):
+        out = dict(feature)
+        out["properties"] = dict(feature.get("properties") or {}, dist=dist_m)
+        return out
+
+    def radius(self, lat, lon, radius_m, limit=None):
+        """Features within `radius_m` of (lat, lon), nearest first, `dist` recomputed in metres."""
+        with self._lock:
+            feats, coords = self._candidates(self._cells_touching(lat, lon, radius_m / 1000))
+        if not feats:
+            return []
+        dist_m = haversine_km(lat, lon, coords[:, 0], coords[:, 1]) * 1000
+        order = np.argsort(dist_m, kind="stable")
+        order = order[dist_m[order] <= radius_m][:limit]
+        return [self._with_dist(feats[i], float(dist_m[i])) for i in order]
+
+    def nearest(self, lat, lon, k):
+        """The k indexed features nearest to (lat, lon), searching outwards ring by ring."""
+        with self._lock:
+            if not self.cell_of:
+                return []
+            r0, c0 = self._cell(lat, lon)
+            rows = [r for r, _ in self.cells]
+            cols = [c for _, c in self.cells]
+            max_ring = max(abs(r0 - min(rows)), abs(r0 - max(rows)), abs(c0 - min(cols)), abs(c0 - max(cols)))
+            feats = []
+            ring = 0
+            while ring <= max_ring:
+                for r in range(r0 - ring, r0 + ring + 1):
+                    for c in range(c0 - ring, c0 + ring + 1):
+                        if max(abs(r - r0), abs(c - c0)) == ring:
+                            feats.extend(self.cells.get((r, c), {}).values())
+                # everything within `ring` cells of the query is now in; stop once k of them are that close
+                if len(feats) >= k:
+                    coords = np.array([feature_coords(f) for f in feats], dtype=np.float64)
+                    dist_km = haversine_km(lat, lon, coords[:, 0], coords[:, 1])
+                    reach_km = ring * self.cell_deg * KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6)
+                    if np.sort(dist_km)[k - 1] <= reach_km:
+                        break
+                ring += 1
+        if not feats:
+            return []
+        coords = np.array([feature_coords(f) for f in feats], dtype=np.float64)
+        dist_m = haversine_km(lat, lon, coords[:, 0], coords[:, 1]) * 1000
+        order = np.argsort(dist_m, kind="stable")[:k]
+        return [self._with_dist(feats[i], float(dist_m[i])) for i in order]
+
+    def stats(self):
+        return {"features": len(self), "covered_cells": len(self.covered),
+                "hits": self.hits, "partial": self.partial, "misses": self.misses}
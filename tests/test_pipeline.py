@@ -0,0 +1,133 @@
+"""
+Regression tests for the recommendation and planning pipeline.
+
+Run from the repository root with `pytest -q`. Everything is offline:
+POIs are synthetic and no API client is called.
+"""
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from data_clients import SingleFlight
+from optimizer import ItineraryGA
+from recommender import recommend_pois, recommend_pois_batch
+from tfidf_store import TfidfModelStore, poi_document
+
+WORDS = ["museum", "art", "gallery", "church", "gothic", "park", "garden", "river",
+         "bridge", "castle", "history", "modern", "sculpture", "zoo", "market", "tower"]
+KINDS = ["museums", "churches", "gardens_and_parks", "historic", "architecture", "zoos", "bridges"]
+
+
+def make_pois(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{
+        "xid": f"N{i}",
+        "name": f"Place {i} {rng.choice(WORDS)}",
+        "kinds": ",".join(rng.choice(KINDS, size=rng.integers(1, 3), replace=False)),
+        "description": " ".join(rng.choice(WORDS, size=rng.integers(0, 8))),
+        "lat": 48.85 + rng.normal(0, 0.01),
+        "lon": 2.35 + rng.normal(0, 0.01),
+    } for i in range(n)]
+
+
+PROFILES = [
+    {"interests": ["art", "museum"], "preferred_kinds": "museums"},
+    {"interests": ["gothic", "church", "history"], "preferred_kinds": "churches,historic"},
+    {"interests": ["park"], "preferred_kinds": ""},
+    {"interests": [], "preferred_kinds": "zoos"},
+]
+
+
+@pytest.fixture(autouse=True)
+def no_cf(monkeypatch):
+    # keep the scores purely content-based: no trained CF model is read from disk
+    monkeypatch.setattr(Config, "CF_WEIGHT", 0.0)
+
+
+def ranking(recs):
+    return [(r["xid"], round(r["score"], 9)) for r in recs]
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_shortlist_matches_brute_force(monkeypatch, profile):
+    pois = make_pois(600)
+    monkeypatch.setattr(Config, "RETRIEVAL_MIN_POIS", 10 ** 9)
+    brute = recommend_pois(pois, profile, top_n=40)
+    monkeypatch.setattr(Config, "RETRIEVAL_MIN_POIS", 1)
+    assert ranking(recommend_pois(pois, profile, top_n=40)) == ranking(brute)
+
+
+def test_batch_matches_per_profile():
+    pois = make_pois(300, seed=1)
+    batch = recommend_pois_batch(pois, PROFILES, top_n=25, chunk_size=3)
+    assert [ranking(recs) for recs in batch] == [ranking(recommend_pois(pois, p, top_n=25)) for p in PROFILES]
+
+
+def test_ox_children_are_permutations():
+    n = 30
+    ga = ItineraryGA(make_pois(n, seed=2), {}, pop_size=64, travel_minutes=np.ones((n, n)), seed=3)
+    parents1, parents2 = ga.initial_pop(), ga.initial_pop()
+    for _ in range(5):
+        children = ga.crossover(parents1, parents2)
+        assert children.shape == parents1.shape
+        assert (np.sort(children, axis=1) == np.arange(n)).all()
+        parents1, parents2 = children, parents1
+
+
+def test_store_rows_follow_upserts_and_removals(tmp_path):
+    store = TfidfModelStore(str(tmp_path), refit_ratio=10.0)
+    pois = make_pois(50, seed=4)
+    store.model_for("Paris", pois)
+
+    edited = dict(pois[7], description="a brand new sculpture garden")
+    update = pois[:7] + [edited] + pois[8:40] + make_pois(55, seed=5)[50:]
+    update = [dict(p, xid=f"M{i}") if i >= 40 else p for i, p in enumerate(update)]
+    model, rows = store.model_for("Paris", update, replace=True)
+
+    assert store.stats["fits"] == 1 and store.stats["updates"] == 1  # updated in place, not refitted
+    assert [model.xids[r] for r in rows] == [p["xid"] for p in update]
+    assert not set(model.xids) & {p["xid"] for p in pois[40:]}
+    expected = model.transform([poi_document(p) for p in update])
+    assert np.allclose(model.X[rows].toarray(), expected.toarray())
+
+
+def test_single_flight_shares_errors():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", fail)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for t in followers:
+        t.start()
+    while flight.stats()["shared"] < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert len(errors) == 4 and all(e is errors[0] for e in errors)
+    assert flight.stats() == {"executed": 1, "shared": 3, "in_flight": 0}
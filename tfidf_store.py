@@ -0,0 +1,352 @@
+"""
+Per-city TF-IDF models for recommend_pois.
+
+Instead of fitting a TfidfVectorizer on every request, the fitted
+vocabulary/IDF and the float32 document matrix of every POI seen for a
+city are kept in memory and persisted to `<dir>/<city>.<corpus hash>.npz`.
+POIs that are new (or whose text changed) are transformed with the
+existing vocabulary and appended; removed POIs are dropped. Once more
+than `refit_ratio` of the corpus has changed since the last fit, the
+vocabulary and IDF are refitted from scratch.
+
+Models are never modified in place: an update builds a new model and
+swaps it into the store, so a request still holding the previous one
+keeps a consistent matrix, row mapping and index.
+"""
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from kinds_index import KINDS, fit_width
+from retrieval import TermIndex
+
+
+def poi_description(p):
+    """Projected description, falling back to the raw detail payload fields."""
+    return (
+        p.get("description")
+        or (p.get("wikipedia_extracts") or {}).get("text", "")
+        or (p.get("info") or {}).get("descr", "")
+        or ""
+    )
+
+
+def poi_fields(p):
+    """(name, kinds, description): the parts of a POI its TF-IDF row depends on."""
+    return p.get("name") or "", p.get("kinds") or "", poi_description(p)
+
+
+def _document(fields):
+    return " ".join(fields)
+
+
+def poi_document(p):
+    """Text used for a POI's TF-IDF row: name + kinds + description."""
+    return _document(poi_fields(p))
+
+
+def _doc_hash(doc):
+    return hashlib.sha1(doc.encode("utf-8")).hexdigest()[:16]
+
+
+def corpus_hash(xids, doc_hashes):
+    h = hashlib.sha1()
+    for xid, dh in sorted(zip(xids, doc_hashes)):
+        h.update(f"{xid}:{dh};".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _pack_texts(name, texts):
+    # one UTF-8 blob + offsets; a fixed-width unicode array would pad every doc to the longest one
+    encoded = [t.encode("utf-8") for t in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return {name + "_blob": np.frombuffer(b"".join(encoded), dtype=np.uint8), name + "_offsets": offsets}
+
+
+def _unpack_texts(z, name):
+    blob = z[name + "_blob"].tobytes()
+    offsets = z[name + "_offsets"]
+    return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+class CityTfidfModel:
+    """
+    Fitted vocabulary/IDF plus one L2-normalized float32 row per POI
+    (immutable). Each row also keeps the POI's poi_fields(), to spot edits
+    without rebuilding documents, and its kinds bitset (kind_bits).
+    """
+
+    def __init__(self, terms, idf, X, xids, fields, n_fitted, stop_words="english",
+                 doc_hashes=None, kind_bits=None):
+        self.terms = list(terms)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.X = sp.csr_matrix(X, dtype=np.float32)
+        self.xids = list(xids)
+        self.fields = [tuple(f) for f in fields]  # kept so the model can be refitted without refetching
+        if doc_hashes is None:
+            doc_hashes = [_doc_hash(d) for d in self.docs]
+        self.doc_hashes = list(doc_hashes)
+        if kind_bits is None:
+            kind_bits = KINDS.encode_many(f[1] for f in self.fields)
+        self.kind_bits = kind_bits
+        self.n_fitted = n_fitted  # corpus size at the last full fit
+        self.changed = 0  # docs added/changed/removed since then
+        self.stop_words = stop_words
+        self.row_of = {x: i for i, x in enumerate(self.xids)}
+        self._index = None
+        self._counter = CountVectorizer(vocabulary={t: i for i, t in enumerate(self.terms)},
+                                        stop_words=stop_words, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, xids, fields, max_features=1500, stop_words="english"):
+        vectorizer = TfidfVectorizer(max_features=max_features, stop_words=stop_words, dtype=np.float32)
+        X = vectorizer.fit_transform([_document(f) for f in fields])
+        terms = [None] * len(vectorizer.vocabulary_)
+        for term, idx in vectorizer.vocabulary_.items():
+            terms[idx] = term
+        return cls(terms, vectorizer.idf_, X, xids, fields, len(fields), stop_words)
+
+    @property
+    def docs(self):
+        return [_document(f) for f in self.fields]
+
+    @property
+    def corpus_hash(self):
+        return corpus_hash(self.xids, self.doc_hashes)
+
+    def transform(self, docs):
+        """Same weighting as TfidfVectorizer.transform with the stored vocabulary and IDF."""
+        counts = self._counter.transform(docs)
+        return normalize(counts @ sp.diags(self.idf), norm="l2", copy=False).astype(np.float32).tocsr()
+
+    @property
+    def index(self):
+        """Inverted index over X for candidate retrieval (rebuilt lazily after updates)."""
+        index = self._index
+        if index is None:
+            index = self._index = TermIndex(self.X)
+        return index
+
+    def rows_for(self, xids):
+        return np.fromiter((self.row_of[x] for x in xids), dtype=np.int64, count=len(xids))
+
+    def _derive(self, X, xids, fields, doc_hashes, kind_bits, changed):
+        model = CityTfidfModel(self.terms, self.idf, X, xids, fields, self.n_fitted, self.stop_words,
+                               doc_hashes, kind_bits)
+        model.changed = changed
+        return model
+
+    def upsert(self, xids, fields):
+        """
+        New model with new POIs appended and changed ones replaced (given as
+        poi_fields() tuples), using the current vocabulary. This model is
+        left as it was.
+        """
+        if not xids:
+            return self
+        docs = [_document(f) for f in fields]
+        new_rows = self.transform(docs)
+        new_bits = KINDS.encode_many(f[1] for f in fields)
+        replace = [x for x in xids if x in self.row_of]
+        base = self.remove(replace)
+        width = max(base.kind_bits.shape[1], new_bits.shape[1])
+        return self._derive(sp.vstack([base.X, new_rows], format="csr"), base.xids + list(xids),
+                            base.fields + list(fields), base.doc_hashes + [_doc_hash(d) for d in docs],
+                            np.vstack([fit_width(base.kind_bits, width), fit_width(new_bits, width)]),
+                            base.changed + len(xids) - len(replace))
+
+    def remove(self, xids):
+        """New model without `xids` (this one when none of them are present)."""
+        drop = set(xids) & set(self.row_of)
+        if not drop:
+            return self
+        keep = np.array([i for i, x in enumerate(self.xids) if x not in drop], dtype=np.int64)
+        return self._derive(self.X[keep], [self.xids[i] for i in keep], [self.fields[i] for i in keep],
+                            [self.doc_hashes[i] for i in keep], self.kind_bits[keep], self.changed + len(drop))
+
+    def save(self, path):
+        # unique per writer, so concurrent saves never replace each other's file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(
+            tmp,
+            terms=np.array(self.terms, dtype=str),
+            idf=self.idf,
+            data=self.X.data, indices=self.X.indices, indptr=self.X.indptr,
+            shape=np.array(self.X.shape, dtype=np.int64),
+            xids=np.array(self.xids, dtype=str),
+            **_pack_texts("names", [f[0] for f in self.fields]),
+            **_pack_texts("kinds", [f[1] for f in self.fields]),
+            **_pack_texts("descriptions", [f[2] for f in self.fields]),
+            n_fitted=np.array(self.n_fitted), changed=np.array(self.changed),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, stop_words="english"):
+        with np.load(path, allow_pickle=False) as z:
+            X = sp.csr_matrix((z["data"], z["indices"], z["indptr"]), shape=tuple(z["shape"]))
+            fields = zip(_unpack_texts(z, "names"), _unpack_texts(z, "kinds"), _unpack_texts(z, "descriptions"))
+            model = cls(z["terms"].tolist(), z["idf"], X, z["xids"].tolist(), fields, int(z["n_fitted"]), stop_words)
+            model.changed = int(z["changed"])
+        return model
+
+
+def _slug(key):
+    """Readable, collision-free file stem of a city key (any script)."""
+    key = unicodedata.normalize("NFKC", key).casefold().strip()
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]
+    return f'{re.sub(r"[^a-z0-9]+", "-", key).strip("-") or "city"}-{digest}'
+
+
+class TfidfModelStore:
+    """
+    Thread-safe store of CityTfidfModel objects, cached in memory (LRU of
+    `max_models`) and persisted under `directory`.
+    """
+
+    def __init__(self, directory, max_features=1500, refit_ratio=0.3, max_models=32):
+        self.directory = directory
+        self.max_features = max_features
+        self.refit_ratio = refit_ratio
+        self.max_models = max_models
+        self.stats = {"hits": 0, "loads": 0, "fits": 0, "updates": 0}
+        self._models = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _city_lock(self, city):
+        with self._lock:
+            return self._locks.setdefault(city, threading.Lock())
+
+    def _path(self, city, digest):
+        return os.path.join(self.directory, f"{_slug(city)}.{digest[:16]}.npz")
+
+    def _load(self, city):
+        """Newest persisted model of `city`, or None (then it is refitted)."""
+        if not self.directory:
+            return None
+        prefix = _slug(city) + "."
+        files = []
+        for f in os.listdir(self.directory):
+            if f.startswith(prefix) and f.endswith(".npz") and not f.endswith(".tmp.npz"):
+                try:
+                    files.append((os.path.getmtime(os.path.join(self.directory, f)), f))
+                except OSError:
+                    pass  # replaced by another process's _save meanwhile
+        for _, f in sorted(files, reverse=True):
+            try:
+                model = CityTfidfModel.load(os.path.join(self.directory, f))
+            except (OSError, ValueError, KeyError):
+                continue  # vanished, half-written or an older file format; try an older one
+            self.stats["loads"] += 1
+            return model
+        return None
+
+    def _save(self, city, model):
+        if not self.directory:
+            return
+        path = self._path(city, model.corpus_hash)
+        model.save(path)
+        prefix = _slug(city) + "."
+        for f in os.listdir(self.directory):
+            full = os.path.join(self.directory, f)
+            # .tmp.npz files are other writers' saves in progress
+            if f.startswith(prefix) and f.endswith(".npz") and not f.endswith(".tmp.npz") and full != path:
+                try:
+                    os.remove(full)
+                except OSError:
+                    pass
+
+    def model_for(self, city, pois, replace=False):
+        """
+        Return (model, rows) where model.X[rows] are the TF-IDF rows of `pois`
+        in order. New or edited POIs are added to the city's model; with
+        replace=True, POIs of the city missing from `pois` are removed too.
+        The returned model is a snapshot: later updates replace it in the
+        store rather than modify it, so `rows` stays valid for it.
+        """
+        xids = [p.get("xid") for p in pois]
+        fields = [poi_fields(p) for p in pois]
+        with self._city_lock(city):
+            with self._lock:
+                model = self._models.get(city)
+                if model is not None:
+                    self._models.move_to_end(city)
+            if model is None:
+                model = self._load(city)
+
+            dirty = False
+            if model is None:
+                unique = dict(zip(xids, fields))
+                model = CityTfidfModel.fit(list(unique), list(unique.values()), self.max_features)
+                self.stats["fits"] += 1
+                dirty = True
+            else:
+                pending = {}
+                rows = []
+                row_of, stored = model.row_of, model.fields
+                # compare the stored fields directly: no document building or hashing per request
+                for x, f in zip(xids, fields):
+                    row = row_of.get(x)
+                    if row is None or stored[row] != f:
+                        pending[x] = f
+                    rows.append(row)
+                if replace:
+                    wanted = set(xids)
+                    stale = [x for x in model.xids if x not in wanted]
+                    if stale:
+                        model = model.remove(stale)
+                        dirty = True
+                if pending:
+                    model = model.upsert(list(pending), list(pending.values()))
+                    dirty = True
+                if dirty:
+                    self.stats["updates"] += 1
+                    if model.changed > self.refit_ratio * max(model.n_fitted, 1):
+                        # too much drift since the last fit: refit vocabulary and IDF
+                        model = CityTfidfModel.fit(model.xids, model.fields, self.max_features)
+                        self.stats["fits"] += 1
+                else:
+                    self.stats["hits"] += 1
+
+            if dirty:
+                try:
+                    self._save(city, model)
+                except OSError:
+                    pass  # persisting is best effort; the model is still served
+            with self._lock:
+                self._models[city] = model
+                self._models.move_to_end(city)
+                while len(self._models) > self.max_models:
+                    self._models.popitem(last=False)
+            if dirty:
+                return model, model.rows_for(xids)
+            return model, np.array(rows, dtype=np.int64)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide TfidfModelStore, or None when Config.TFIDF_MODEL_DIR is empty."""
+    global _store
+    from config import Config
+    if not Config.TFIDF_MODEL_DIR:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = TfidfModelStore(Config.TFIDF_MODEL_DIR, refit_ratio=Config.TFIDF_REFIT_RATIO,
+                                     max_models=Config.TFIDF_MAX_MODELS)
+    return _store